@@ -1 +1 @@
-from .db_depends import get_db
\ No newline at end of file
+from .db_depends import get_db, get_read_db
@@ -0,0 +1,64 @@
+import codecs
+import csv
+import os
+from itertools import islice
+from typing import BinaryIO, Iterator
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+load_dotenv()
+
+# Строк в одном multi-row upsert; 1000 строк x 9 колонок укладываются в лимит параметров SQLite и Postgres
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 1000))
+# Сколько ошибок по строкам отдавать в отчёте, остальные только считаются
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", 1000))
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(filename: str | None, content_type: str | None, requested: str | None) -> str:
+    if requested:
+        return requested
+    if (filename or '').lower().endswith('.csv') or content_type == 'text/csv':
+        return 'csv'
+    if (filename or '').lower().endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson',
+                                                                                   'application/jsonl'):
+        return 'ndjson'
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Unknown file format, expected one of: {', '.join(IMPORT_FORMATS)}")
+
+
+def iter_rows(file: BinaryIO, fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    '''Построчно читает загруженный файл: (номер строки, данные или None, ошибка разбора или None).
+
+    Файл не загружается в память целиком: python-multipart уже сбросил его на диск,
+    здесь он читается потоком через инкрементальный декодер.
+    '''
+    lines = codecs.iterdecode(file, 'utf-8-sig')
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            if None in row:
+                yield reader.line_num, None, 'Too many columns'
+            else:
+                yield reader.line_num, row, None
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = orjson.loads(line)
+        except orjson.JSONDecodeError as error:
+            yield number, None, f'Invalid JSON: {error}'
+            continue
+        if isinstance(row, dict):
+            yield number, row, None
+        else:
+            yield number, None, 'Expected a JSON object'
+
+
+def chunked(rows: Iterator, size: int = IMPORT_CHUNK_SIZE) -> Iterator[list]:
+    while chunk := list(islice(rows, size)):
+        yield chunk
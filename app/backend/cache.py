@@ -0,0 +1,454 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable
+
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.backend.category_tree import category_tree
+from app.backend.compression import (COMPRESSION_MIN_SIZE, CODECS, compression_stats, negotiate, vary_on_encoding,
+                                     weak_etag)
+from app.backend.db_depends import READ_YOUR_WRITES_WINDOW, wrote_recently
+from app.backend.invalidation import invalidation_bus
+from app.backend.responses import etag_for, conditional_response, not_modified
+from app.backend.singleflight import SingleFlight, single_flight
+
+load_dotenv()
+
+# memory - LRU в памяти процесса, redis - общий кэш для всех воркеров (нужен пакет redis)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", 'memory')
+CACHE_URL = os.getenv("CACHE_URL", 'redis://localhost:6379/0')
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10_000))
+# Сколько секунд ответ считается свежим и сколько ещё его можно отдавать, пока идёт фоновое обновление.
+# CACHE_TTL=0 выключает кэш
+CACHE_TTL = float(os.getenv("CACHE_TTL", 30))
+CACHE_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", 60))
+# Сколько секунд Redis хранит счётчик сбросов тега
+GENERATION_TTL = 3600
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    fresh_until: float
+    stale_until: float
+    # Валидаторы условных GET: считаются один раз при записи в кэш
+    etag: str = ''
+    modified: float = 0.0
+    # Сжатые варианты тела по кодировке: каждый считается один раз, при первом запросе с этой кодировкой
+    variants: dict[str, bytes] = field(default_factory=dict)
+
+
+class MemoryBackend:
+    '''LRU с ограничением по числу записей и индексом тег -> ключи для точечной инвалидации'''
+
+    # Кэш свой у каждого воркера: инвалидации рассылаются остальным через шину
+    shared = False
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.tags: dict[str, set[str]] = {}
+        self.key_tags: dict[str, tuple[str, ...]] = {}
+        # Номер сброса по каждому тегу и по кэшу целиком: загрузка, начатая до сброса, не кладёт тело
+        self.tag_generations: dict[str, int] = {}
+        self.generation = 0
+        # Время последнего сброса по тегу и кэша целиком: тело с реплики после недавнего сброса не кладётся
+        self.invalidated_at: dict[str, float] = {}
+        self.cleared_at = 0.0
+        self.evictions = 0
+
+    async def get(self, key: str) -> CacheEntry | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.stale_until <= time.time():
+            self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    async def get_many(self, keys: list[str]) -> list[CacheEntry | None]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, entry: CacheEntry, tags: Iterable[str]):
+        self._drop(key)
+        self.entries[key] = entry
+        self.key_tags[key] = tuple(tags)
+        for tag in self.key_tags[key]:
+            self.tags.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    async def set_variant(self, key: str, entry: CacheEntry, encoding: str, body: bytes):
+        current = self.entries.get(key)
+        if current is not None and current.etag == entry.etag:
+            current.variants[encoding] = body
+
+    async def delete(self, key: str):
+        self._drop(key)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        keys = set()
+        now = time.time()
+        for tag in tags:
+            keys |= self.tags.pop(tag, set())
+            self.tag_generations[tag] = self.tag_generations.get(tag, 0) + 1
+            self.invalidated_at[tag] = now
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    async def generations(self, tags: Iterable[str]) -> dict[str | None, int]:
+        '''Номер сброса по каждому тегу; под None - номер сброса кэша целиком'''
+        return {None: self.generation, **{tag: self.tag_generations.get(tag, 0) for tag in tags}}
+
+    async def invalidated_since(self, tags: Iterable[str], since: float) -> bool:
+        return self.cleared_at >= since or any(self.invalidated_at.get(tag, 0.0) >= since for tag in tags)
+
+    def clear(self):
+        self.generation += 1
+        self.cleared_at = time.time()
+        self.entries.clear()
+        self.tags.clear()
+        self.key_tags.clear()
+
+    def _drop(self, key: str):
+        if self.entries.pop(key, None) is None:
+            return
+        for tag in self.key_tags.pop(key, ()):
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def stats(self) -> dict:
+        return {'backend': 'memory', 'entries': len(self.entries), 'max_entries': self.max_entries,
+                'evictions': self.evictions}
+
+
+class RedisBackend:
+    '''Общий для всех воркеров кэш в Redis; вытеснение по памяти делает сам Redis (maxmemory-policy)'''
+
+    shared = True
+
+    def __init__(self, url: str = CACHE_URL, prefix: str = 'shop:cache:'):
+        from redis import asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> CacheEntry | None:
+        return self._entry(await self.client.hgetall(self.prefix + key))
+
+    async def get_many(self, keys: list[str]) -> list[CacheEntry | None]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(self.prefix + key)
+            rows = await pipe.execute()
+        return [self._entry(row) for row in rows]
+
+    @staticmethod
+    def _entry(values: dict[bytes, bytes]) -> CacheEntry | None:
+        body = values.get(b'body')
+        if body is None or b'fresh_until' not in values:
+            return None
+        # Записи, положенные до появления валидаторов, получают их на лету
+        etag = values[b'etag'].decode() if values.get(b'etag') else etag_for(body)
+        modified = float(values[b'modified']) if values.get(b'modified') else time.time()
+        # Вариант хранится в поле variant:<кодировка>:<etag> и годится только для тела с тем же ETag
+        suffix = f':{etag}'.encode()
+        variants = {name[len(b'variant:'):-len(suffix)].decode(): data for name, data in values.items()
+                    if name.startswith(b'variant:') and name.endswith(suffix)}
+        return CacheEntry(body, float(values[b'fresh_until']), float(values[b'stale_until']), etag, modified,
+                          variants)
+
+    async def set(self, key: str, entry: CacheEntry, tags: Iterable[str]):
+        ttl = max(1, int(entry.stale_until - time.time()))
+        async with self.client.pipeline(transaction=False) as pipe:
+            # Поля вариантов прежнего тела удаляются вместе с ним
+            pipe.delete(self.prefix + key)
+            pipe.hset(self.prefix + key, mapping={
+                'body': entry.body, 'fresh_until': entry.fresh_until, 'stale_until': entry.stale_until,
+                'etag': entry.etag, 'modified': entry.modified})
+            pipe.expire(self.prefix + key, ttl)
+            for tag in tags:
+                pipe.sadd(self.prefix + 'tag:' + tag, key)
+                # GT не ставит TTL ключу без TTL, поэтому новому набору тега его задаёт NX
+                pipe.expire(self.prefix + 'tag:' + tag, ttl, nx=True)
+                pipe.expire(self.prefix + 'tag:' + tag, ttl, gt=True)
+            await pipe.execute()
+
+    async def set_variant(self, key: str, entry: CacheEntry, encoding: str, body: bytes):
+        ttl = max(1, int(entry.stale_until - time.time()))
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(self.prefix + key, f'variant:{encoding}:{entry.etag}', body)
+            # Если запись уже сбросили, осиротевшее поле всё равно истечёт; TTL живой записи не трогаем
+            pipe.expire(self.prefix + key, ttl, nx=True)
+            await pipe.execute()
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        tags = list(tags)
+        tag_keys = [self.prefix + 'tag:' + tag for tag in tags]
+        keys = set()
+        for tag_key in tag_keys:
+            keys |= {key.decode() for key in await self.client.smembers(tag_key)}
+        async with self.client.pipeline(transaction=False) as pipe:
+            if keys or tag_keys:
+                pipe.delete(*(self.prefix + key for key in keys), *tag_keys)
+            for tag in tags:
+                pipe.incr(self.prefix + 'gen:' + tag)
+                # Счётчик нужен только на время загрузки; истёкший счётчик лишь отменит одну запись в кэш
+                pipe.expire(self.prefix + 'gen:' + tag, GENERATION_TTL)
+                pipe.set(self.prefix + 'invalidated:' + tag, time.time(), ex=READ_YOUR_WRITES_WINDOW + 1)
+            await pipe.execute()
+        return len(keys)
+
+    async def generations(self, tags: Iterable[str]) -> dict[str | None, bytes | None]:
+        tags = list(tags)
+        return dict(zip(tags, await self.client.mget([self.prefix + 'gen:' + tag for tag in tags]))) if tags else {}
+
+    async def invalidated_since(self, tags: Iterable[str], since: float) -> bool:
+        tags = list(tags)
+        if not tags:
+            return False
+        values = await self.client.mget([self.prefix + 'invalidated:' + tag for tag in tags])
+        return any(value is not None and float(value) >= since for value in values)
+
+    def stats(self) -> dict:
+        return {'backend': 'redis'}
+
+
+class ResponseCache:
+    '''Кэш готовых тел ответов со stale-while-revalidate.
+
+    Свежая запись отдаётся сразу. Устаревшая (но не старше stale_ttl) тоже отдаётся сразу,
+    а её обновление запускается в фоне - не больше одного на ключ. Одновременные промахи
+    по одному ключу склеиваются в одну загрузку через SingleFlight.
+
+    Клиент с кукой read-your-writes читает мимо кэша с основной базы. Тело, прочитанное с реплики
+    в течение READ_YOUR_WRITES_WINDOW после сброса его тегов, отдаётся, но в кэш не кладётся:
+    реплика могла ещё не догнать запись, из-за которой теги сбросили.
+    '''
+
+    def __init__(self, backend, ttl: float = CACHE_TTL, stale_ttl: float = CACHE_STALE_TTL,
+                 flights: SingleFlight = single_flight):
+        self.backend = backend
+        self.flights = flights
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.discarded_loads = 0
+        self.pinned_bypasses = 0
+        self.replica_discards = 0
+        self._refreshing: dict[str, asyncio.Task] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def get_or_load(self, key: str, tags: Iterable[str], loader: Callable[[], Awaitable[bytes]],
+                          request: Request | None = None) -> bytes:
+        return (await self.get_or_load_entry(key, tags, loader, request)).body
+
+    async def get_or_load_entry(self, key: str, tags: Iterable[str], loader: Callable[[], Awaitable[bytes]],
+                                request: Request | None = None) -> CacheEntry:
+        '''То же, что get_or_load, но вместе с ETag и временем сборки тела.
+
+        Клиент, закреплённый за основной базой, не склеивается с другими: общая загрузка выполняется
+        с request первого и могла прочитать реплику до его записи.
+        '''
+        pinned = request is not None and wrote_recently(request)
+        if not self.enabled:
+            return self.entry(await (loader() if pinned else self.flights.do(key, loader)))
+        if pinned:
+            # Запись в кэше может быть старше только что сделанной клиентом записи
+            self.pinned_bypasses += 1
+            return await self._load(key, tuple(tags), loader, request)
+        entry = await self.backend.get(key)
+        if entry is not None:
+            if entry.fresh_until > time.time():
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing[key] = asyncio.create_task(self._refresh(key, tuple(tags), loader, request))
+            return entry
+        self.misses += 1
+        return await self.flights.do(key, lambda: self._load(key, tuple(tags), loader, request))
+
+    async def get_many(self, keys: list[str], request: Request | None = None) -> dict[str, bytes]:
+        '''Свежие записи по списку ключей за одно обращение к бэкенду.
+
+        Устаревшие и отсутствующие ключи считаются промахами: их догружает и кладёт через store_many
+        вызывающий, одним запросом на все.
+        '''
+        if not self.enabled or not keys:
+            return {}
+        if request is not None and wrote_recently(request):
+            self.pinned_bypasses += 1
+            return {}
+        now = time.time()
+        found = {key: entry.body for key, entry in zip(keys, await self.backend.get_many(keys))
+                 if entry is not None and entry.fresh_until > now}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def generations(self, keys: list[str]) -> dict:
+        '''Снимок номеров сброса для store_many; берётся до чтения тел из базы'''
+        return await self.backend.generations(keys) if self.enabled and keys else {}
+
+    async def store_many(self, bodies: dict[str, bytes], generations: dict, request: Request | None = None,
+                         started: float = 0.0):
+        '''Кладёт записи, помечая каждую тегом, равным её ключу (как карточки товаров).
+
+        generations - снимок self.generations(ключи), сделанный до чтения: ключ, сброшенный с тех пор,
+        не кладётся, как и в _load. started - когда началось чтение; нужен, чтобы не класть прочитанное
+        с реплики после недавнего сброса.
+        '''
+        if not self.enabled or not bodies:
+            return
+        current = await self.backend.generations(bodies)
+        for key, body in bodies.items():
+            if key not in generations or current.get(key) != generations[key] \
+                    or current.get(None) != generations.get(None):
+                self.discarded_loads += 1
+                continue
+            if await self._from_lagging_replica((key,), request, started):
+                continue
+            await self.store(key, [key], body)
+
+    async def store_variant(self, key: str, entry: CacheEntry, encoding: str, body: bytes):
+        entry.variants[encoding] = body
+        if self.enabled:
+            await self.backend.set_variant(key, entry, encoding, body)
+
+    async def _load(self, key: str, tags: tuple[str, ...], loader: Callable[[], Awaitable[bytes]],
+                    request: Request | None = None) -> CacheEntry:
+        started = time.time()
+        generations = await self.backend.generations(tags)
+        body = await loader()
+        if await self.backend.generations(tags) != generations:
+            # Пока тело собиралось, теги сбросили: оно могло прочитать старые данные, в кэш его не кладём
+            self.discarded_loads += 1
+            return self.entry(body)
+        if await self._from_lagging_replica(tags, request, started):
+            return self.entry(body)
+        return await self.store(key, tags, body)
+
+    async def _from_lagging_replica(self, tags: Iterable[str], request: Request | None, started: float) -> bool:
+        '''Тело прочитано с реплики, а его теги сбросили незадолго до начала чтения'''
+        if request is None or getattr(request.state, 'db_role', None) != 'replica':
+            return False
+        if not await self.backend.invalidated_since(tags, started - READ_YOUR_WRITES_WINDOW):
+            return False
+        self.replica_discards += 1
+        return True
+
+    def entry(self, body: bytes) -> CacheEntry:
+        now = time.time()
+        return CacheEntry(body, now + self.ttl, now + self.ttl + self.stale_ttl, etag_for(body), now)
+
+    async def store(self, key: str, tags: Iterable[str], body: bytes) -> CacheEntry:
+        entry = self.entry(body)
+        await self.backend.set(key, entry, tags)
+        return entry
+
+    async def _refresh(self, key: str, tags: tuple[str, ...], loader: Callable[[], Awaitable[bytes]],
+                       request: Request | None = None):
+        try:
+            await self.flights.do(key, lambda: self._load(key, tags, loader, request))
+            self.refreshes += 1
+        except Exception:
+            # Например, товар удалён: пусть следующий запрос пройдёт обычным путём
+            self.refresh_errors += 1
+            await self.backend.delete(key)
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def invalidate(self, *tags: str):
+        if self.enabled and tags:
+            self.invalidations += await self.backend.invalidate_tags(tags)
+            if not self.backend.shared:
+                invalidation_bus.publish('cache', None, list(dict.fromkeys(tags)))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            **self.backend.stats(),
+            'ttl': self.ttl,
+            'stale_ttl': self.stale_ttl,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'refreshes': self.refreshes,
+            'refresh_errors': self.refresh_errors,
+            'discarded_loads': self.discarded_loads,
+            'pinned_bypasses': self.pinned_bypasses,
+            'replica_discards': self.replica_discards,
+            'refreshing': len(self._refreshing),
+        }
+
+
+response_cache = ResponseCache(RedisBackend() if CACHE_BACKEND == 'redis' else MemoryBackend())
+if not response_cache.backend.shared:
+    invalidation_bus.subscribe('cache', lambda _, tags: response_cache.backend.invalidate_tags(tags))
+    invalidation_bus.on_resync(response_cache.backend.clear)
+
+
+async def invalidate_products(slugs: Iterable[str], category_ids: Iterable[int | None]):
+    '''Сбрасывает карточки товаров и листинги их категорий вместе со всеми предками'''
+    tags = ['listing:all', *(f'product:{slug}' for slug in slugs)]
+    for category_id in category_ids:
+        category_slugs = category_tree.ancestor_slugs(category_id)
+        if category_slugs is None:
+            # Категории нет в индексе - не угадываем, сбрасываем все листинги
+            tags.append('listings')
+        else:
+            tags.extend(f'listing:{slug}' for slug in category_slugs)
+    await response_cache.invalidate(*tags)
+
+
+async def cached_response(request: Request, key: str, tags: Iterable[str],
+                          loader: Callable[[], Awaitable[bytes]]) -> Response:
+    '''Ответ из кэша с ETag и Last-Modified, сжатый по Accept-Encoding.
+
+    Если клиент прислал валидатор текущей записи, отдаётся 304: при попадании в кэш без запроса
+    к базе и без сериализации. Сжатый вариант тела хранится рядом с записью кэша, так что одна
+    версия ответа сжимается каждой кодировкой один раз, а не на каждый запрос.
+    '''
+    entry = await response_cache.get_or_load_entry(key, tags, loader, request)
+    encoding = negotiate(request.headers.get('accept-encoding')) if len(entry.body) >= COMPRESSION_MIN_SIZE else None
+    etag = entry.etag if encoding is None else weak_etag(entry.etag)
+    if encoding is None or not_modified(request, etag, entry.modified):
+        response = conditional_response(request, entry.body, etag, entry.modified)
+    else:
+        body = entry.variants.get(encoding)
+        if body is None:
+            body = CODECS[encoding].compress(entry.body)
+            compression_stats.record(encoding, len(entry.body), len(body))
+            await response_cache.store_variant(key, entry, encoding, body)
+        else:
+            compression_stats.cached_variants += 1
+        response = conditional_response(request, body, etag, entry.modified)
+        response.headers['Content-Encoding'] = encoding
+    if CODECS:
+        vary_on_encoding(response.headers)
+    return response
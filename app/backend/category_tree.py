@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.backend.invalidation import invalidation_bus
+from app.models.category import Category
+
+load_dotenv()
+
+CATEGORY_TREE_TTL = float(os.getenv("CATEGORY_TREE_TTL", 300))
+
+
+@dataclass
+class CategoryNode:
+    id: int
+    name: str
+    slug: str
+    parent_id: int | None
+    is_active: bool
+
+    def as_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'slug': self.slug,
+            'is_active': self.is_active,
+            'parent_id': self.parent_id,
+        }
+
+
+class CategoryTree:
+    '''Индекс таблицы categories в памяти процесса.
+
+    Загружается целиком при первом обращении и по истечении CATEGORY_TREE_TTL,
+    а ручки записи категорий точечно обновляют его после commit. Остальные воркеры
+    получают событие через шину инвалидации и перечитывают дерево целиком.
+    '''
+
+    def __init__(self, ttl: float = CATEGORY_TREE_TTL):
+        self.ttl = ttl
+        self.nodes: dict[int, CategoryNode] = {}
+        self.by_slug: dict[str, int] = {}
+        self.children: dict[int | None, set[int]] = {}
+        self.loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    async def ensure_loaded(self, session: AsyncSession) -> 'CategoryTree':
+        if not self.is_fresh():
+            async with self._lock:
+                if not self.is_fresh():
+                    await self.rebuild(session)
+        return self
+
+    async def rebuild(self, session: AsyncSession):
+        rows = await session.execute(
+            select(Category.id, Category.name, Category.slug, Category.parent_id, Category.is_active)
+        )
+        self.nodes, self.by_slug, self.children = {}, {}, {}
+        for row in rows:
+            self._add(CategoryNode(row.id, row.name, row.slug, row.parent_id, bool(row.is_active)))
+        self.loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def _add(self, node: CategoryNode):
+        self.nodes[node.id] = node
+        self.by_slug[node.slug] = node.id
+        self.children.setdefault(node.parent_id, set()).add(node.id)
+
+    def upsert(self, category_id: int, name: str, slug: str, parent_id: int | None, is_active: bool = True):
+        old = self.nodes.get(category_id)
+        if old is not None:
+            self.children.get(old.parent_id, set()).discard(category_id)
+            if self.by_slug.get(old.slug) == category_id:
+                del self.by_slug[old.slug]
+        self._add(CategoryNode(category_id, name, slug, parent_id, is_active))
+        invalidation_bus.publish('category', category_id)
+
+    def deactivate(self, category_id: int):
+        node = self.nodes.get(category_id)
+        if node is not None:
+            node.is_active = False
+        invalidation_bus.publish('category', category_id)
+
+    def get(self, category_id: int) -> CategoryNode | None:
+        return self.nodes.get(category_id)
+
+    def get_by_slug(self, slug: str) -> CategoryNode | None:
+        category_id = self.by_slug.get(slug)
+        return self.nodes.get(category_id) if category_id is not None else None
+
+    def descendant_ids(self, slug: str) -> list[int] | None:
+        '''Id активной категории и всех её активных потомков на любой глубине'''
+        root = self.get_by_slug(slug)
+        if root is None or not root.is_active:
+            return None
+        result, stack, seen = [], [root.id], set()
+        while stack:
+            category_id = stack.pop()
+            if category_id in seen:
+                continue
+            seen.add(category_id)
+            result.append(category_id)
+            stack.extend(child for child in self.children.get(category_id, ())
+                         if self.nodes[child].is_active)
+        return result
+
+    def ancestor_slugs(self, category_id: int | None) -> list[str] | None:
+        '''Slug самой категории и всех её предков; None, если категории нет в индексе'''
+        if category_id not in self.nodes:
+            return None
+        slugs, seen = [], set()
+        while category_id is not None and category_id in self.nodes and category_id not in seen:
+            seen.add(category_id)
+            node = self.nodes[category_id]
+            slugs.append(node.slug)
+            category_id = node.parent_id
+        return slugs
+
+    def path(self, category_id: int) -> str:
+        '''Путь /id корня/.../id категории/, как в product_listing.category_path'''
+        ids, seen = [], set()
+        while category_id is not None and category_id in self.nodes and category_id not in seen:
+            seen.add(category_id)
+            ids.append(category_id)
+            category_id = self.nodes[category_id].parent_id
+        return '/' + ''.join(f'{category_id}/' for category_id in reversed(ids))
+
+    def active(self) -> list[CategoryNode]:
+        return sorted((node for node in self.nodes.values() if node.is_active), key=lambda node: node.name or '')
+
+
+category_tree = CategoryTree()
+invalidation_bus.subscribe('category', lambda category_id, _: category_tree.invalidate())
+invalidation_bus.on_resync(category_tree.invalidate)
@@ -0,0 +1,253 @@
+import gzip
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Callable
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+
+load_dotenv()
+
+# Кодировки в порядке предпочтения сервера; br и zstd включаются, только если установлены brotli и zstandard
+COMPRESSION_ENCODINGS = [name.strip() for name in os.getenv("COMPRESSION_ENCODINGS", 'zstd,br,gzip').split(',')
+                         if name.strip()]
+# Ответы меньше порога отдаются как есть: выигрыш в байтах не окупает CPU
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'}
+
+
+class StreamEncoder:
+    '''Сжатие потока по частям: каждая часть сбрасывается сразу, чтобы клиент не ждал конца выгрузки'''
+
+    def __init__(self, process: Callable[[bytes], bytes], flush: Callable[[], bytes], finish: Callable[[], bytes]):
+        self.process = process
+        self.flush = flush
+        self.finish = finish
+
+    def encode(self, chunk: bytes, last: bool) -> bytes:
+        data = self.process(chunk) if chunk else b''
+        return data + (self.finish() if last else self.flush())
+
+
+@dataclass
+class Codec:
+    name: str
+    compress: Callable[[bytes], bytes]
+    stream: Callable[[], StreamEncoder]
+
+
+def gzip_codec() -> Codec:
+    def stream() -> StreamEncoder:
+        encoder = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return StreamEncoder(encoder.compress, lambda: encoder.flush(zlib.Z_SYNC_FLUSH), encoder.flush)
+
+    return Codec('gzip', lambda data: gzip.compress(data, GZIP_LEVEL, mtime=0), stream)
+
+
+def brotli_codec() -> Codec | None:
+    try:
+        import brotli
+    except ImportError:
+        return None
+
+    def stream() -> StreamEncoder:
+        encoder = brotli.Compressor(quality=BROTLI_QUALITY)
+        return StreamEncoder(encoder.process, encoder.flush, encoder.finish)
+
+    return Codec('br', lambda data: brotli.compress(data, quality=BROTLI_QUALITY), stream)
+
+
+def zstd_codec() -> Codec | None:
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+
+    def stream() -> StreamEncoder:
+        encoder = compressor.compressobj()
+        return StreamEncoder(encoder.compress, lambda: encoder.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+                             encoder.flush)
+
+    return Codec('zstd', compressor.compress, stream)
+
+
+def available_codecs(names: list[str] = COMPRESSION_ENCODINGS) -> dict[str, Codec]:
+    factories = {'gzip': gzip_codec, 'br': brotli_codec, 'zstd': zstd_codec}
+    codecs = {}
+    for name in names:
+        codec = factories[name]() if name in factories else None
+        if codec is not None:
+            codecs[name] = codec
+    return codecs
+
+
+CODECS = available_codecs()
+
+
+def negotiate(accept_encoding: str | None, codecs: dict[str, Codec] = CODECS) -> str | None:
+    '''Кодировка с наибольшим q из Accept-Encoding; при равных q - по порядку COMPRESSION_ENCODINGS'''
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        weight = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for name in codecs:
+        weight = weights.get(name, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def weak_etag(etag: str) -> str:
+    # Сжатое тело побайтно отличается от исходного, поэтому сильный ETag ему не подходит
+    return etag if not etag or etag.startswith('W/') else 'W/' + etag
+
+
+class CompressionStats:
+    def __init__(self):
+        self.compressed: dict[str, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.streams = 0
+        self.cached_variants = 0
+        self.skipped_small = 0
+
+    def record(self, encoding: str, raw: int, compressed: int):
+        self.compressed[encoding] = self.compressed.get(encoding, 0) + 1
+        self.bytes_in += raw
+        self.bytes_out += compressed
+
+    def as_dict(self) -> dict:
+        return {
+            'encodings': list(CODECS),
+            'min_size': COMPRESSION_MIN_SIZE,
+            'compressed': self.compressed,
+            'streams': self.streams,
+            'cached_variants': self.cached_variants,
+            'skipped_small': self.skipped_small,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else 0.0,
+        }
+
+
+compression_stats = CompressionStats()
+
+
+def vary_on_encoding(headers: MutableHeaders):
+    vary = headers.get('vary', '')
+    if 'accept-encoding' not in vary.lower():
+        headers['Vary'] = f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'
+
+
+def compressible(status: int, headers: Headers) -> bool:
+    if status < 200 or status in (204, 304) or 'content-encoding' in headers:
+        return False
+    if 'no-transform' in headers.get('cache-control', ''):
+        return False
+    return headers.get('content-type', '').split(';')[0].strip() in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    '''Сжимает ответы по Accept-Encoding (zstd, br, gzip).
+
+    Части тела копятся до COMPRESSION_MIN_SIZE: ответ, закончившийся раньше (типичный ответ ручки
+    записи), уходит как есть без затрат CPU. Длинные потоки (выгрузка) сжимаются по частям со сбросом
+    после каждой. Ответы, которые уже сжаты (готовые варианты из кэша), пропускаются как есть.
+    '''
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, stats: CompressionStats = compression_stats):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not CODECS:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get('accept-encoding'))
+        start: dict | None = None
+        headers: MutableHeaders | None = None
+        buffer: list[bytes] = []
+        buffered = 0
+        encoder: StreamEncoder | None = None
+
+        def encode(body: bytes, last: bool) -> bytes:
+            compressed = encoder.encode(body, last)
+            self.stats.bytes_in += len(body)
+            self.stats.bytes_out += len(compressed)
+            return compressed
+
+        async def send_compressed(message):
+            nonlocal start, headers, buffered, encoder
+            if message['type'] == 'http.response.start':
+                start = {**message, 'headers': list(message.get('headers', []))}
+                headers = MutableHeaders(raw=start['headers'])
+                if not compressible(start['status'], headers):
+                    start = None
+                    await send(message)
+                    return
+                vary_on_encoding(headers)
+                if encoding is None:
+                    await send(start)
+                    start = None
+                # Иначе заголовки ждут тела: сжимать ли, решается по его размеру
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+            if start is None:
+                if encoder is not None:
+                    message = {**message, 'body': encode(message.get('body', b''), not message.get('more_body', False))}
+                await send(message)
+                return
+
+            # Тело может прийти частями (в том числе через BaseHTTPMiddleware) - копим до порога
+            body, more_body = message.get('body', b''), message.get('more_body', False)
+            buffer.append(body)
+            buffered += len(body)
+            if more_body and buffered < self.minimum_size:
+                return
+            first, start = start, None
+            body = b''.join(buffer)
+            buffer.clear()
+            if not more_body and buffered < self.minimum_size:
+                self.stats.skipped_small += 1
+                await send(first)
+                await send({'type': 'http.response.body', 'body': body})
+                return
+            headers['Content-Encoding'] = encoding
+            if 'etag' in headers:
+                headers['ETag'] = weak_etag(headers['etag'])
+            if not more_body:
+                compressed = CODECS[encoding].compress(body)
+                self.stats.record(encoding, len(body), len(compressed))
+                headers['Content-Length'] = str(len(compressed))
+                await send(first)
+                await send({'type': 'http.response.body', 'body': compressed})
+                return
+            if 'content-length' in headers:
+                del headers['Content-Length']
+            encoder = CODECS[encoding].stream()
+            self.stats.record(encoding, 0, 0)
+            self.stats.streams += 1
+            await send(first)
+            await send({'type': 'http.response.body', 'body': encode(body, False), 'more_body': True})
+
+        await self.app(scope, receive, send_compressed)
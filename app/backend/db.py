@@ -1,17 +1,150 @@
+import asyncio
 import os
+import time
+from collections import deque
 
 from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.backend.timing import add_pool_wait
 
 load_dotenv()
 
 DB_URL = os.getenv("DB_URL")
+# Необязательная реплика для читающих ручек, без неё всё идёт в основную базу
+DB_REPLICA_URL = os.getenv("DB_REPLICA_URL")
 DEBUG = True if os.getenv("DEBUG") == 'True' else False
-engine = create_async_engine(DB_URL, echo=DEBUG)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", 'True') == 'True'
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", DB_POOL_SIZE))
+# Размер кэша подготовленных выражений asyncpg на соединение, 0 - выключить (нужно за pgbouncer)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+DB_REPLICA_RETRY = float(os.getenv("DB_REPLICA_RETRY", 30))
+
+
+class PoolWaitStats:
+    '''Время ожидания соединения из пула, чтобы подбирать размер пула по данным'''
+
+    def __init__(self, window: int = 1000):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.checkouts += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_stats.record(waited)
+            add_pool_wait(waited)
+
+
+def engine_options(url: str) -> dict:
+    url = make_url(url)
+    options = {'echo': DEBUG}
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory SQLite живёт в одном соединении, пул ему не нужен
+        return {'url': url, **options}
+    if url.get_driver_name() == 'asyncpg' and 'prepared_statement_cache_size' not in url.query:
+        url = url.update_query_dict({'prepared_statement_cache_size': str(DB_STATEMENT_CACHE_SIZE)})
+    return {
+        'url': url,
+        'poolclass': TimedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        **options,
+    }
+
+
+engine = create_async_engine(**engine_options(DB_URL))
 # engine = create_engine('sqlite:///my.db', echo=True)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-SessionLocal = sessionmaker(bind=engine)
+
+replica_engine = create_async_engine(**engine_options(DB_REPLICA_URL)) if DB_REPLICA_URL else None
+replica_session_maker = async_sessionmaker(replica_engine, expire_on_commit=False, class_=AsyncSession) \
+    if replica_engine else None
+
+
+class ReplicaHealth:
+    '''После ошибки соединения реплика выводится из работы на DB_REPLICA_RETRY секунд'''
+
+    def __init__(self, retry_after: float = DB_REPLICA_RETRY):
+        self.retry_after = retry_after
+        self.down_until = 0.0
+        self.failures = 0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self):
+        self.failures += 1
+        self.down_until = time.monotonic() + self.retry_after
+
+
+replica_health = ReplicaHealth()
+
+
+def pool_status(db_engine: AsyncEngine = engine) -> dict:
+    pool = db_engine.pool
+    status = {'pool_class': type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update({
+            'size': pool.size(),
+            'in_use': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        })
+    stats = getattr(pool, 'wait_stats', None)
+    if stats is not None:
+        status.update({
+            'checkouts': stats.checkouts,
+            'wait_avg_ms': round(stats.total_wait / stats.checkouts * 1000, 3) if stats.checkouts else 0.0,
+            'wait_p99_ms': round(stats.percentile(0.99) * 1000, 3),
+            'wait_max_ms': round(stats.max_wait * 1000, 3),
+        })
+    return status
+
+
+async def warm_up_pool(db_engine: AsyncEngine = engine, count: int = DB_POOL_WARMUP):
+    '''Открывает соединения заранее, чтобы первые запросы после деплоя не платили за подключение'''
+    if not isinstance(db_engine.pool, AsyncAdaptedQueuePool):
+        count = 1
+    connections = await asyncio.gather(*(db_engine.connect() for _ in range(min(count, DB_POOL_SIZE))))
+    try:
+        for connection in connections:
+            await connection.exec_driver_sql('SELECT 1')
+    finally:
+        for connection in connections:
+            await connection.close()
 
 # from app.models import Base
-# Base.metadata.create_all(bind=engine)
\ No newline at end of file
+# Base.metadata.create_all(bind=engine)
@@ -1,8 +1,20 @@
+import os
+import time
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.backend.db import async_session_maker
+from app.backend.db import async_session_maker, replica_session_maker, replica_health
+
+load_dotenv()
+
+# Сколько секунд после своей записи клиент читает с основной базы, чтобы не увидеть отставание реплики
+READ_YOUR_WRITES_WINDOW = int(os.getenv("READ_YOUR_WRITES_WINDOW", 5))
+READ_YOUR_WRITES_COOKIE = 'read_primary_until'
 
 
 # async def get_db():
@@ -13,7 +25,49 @@ from app.backend.db import async_session_maker
 #         db.close()
 
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
+async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    request.state.db_role = 'primary'
     async with async_session_maker() as session:
         yield session
 
+
+def remember_write(response: Response):
+    until = int(time.time()) + READ_YOUR_WRITES_WINDOW
+    response.set_cookie(READ_YOUR_WRITES_COOKIE, str(until), max_age=READ_YOUR_WRITES_WINDOW, httponly=True)
+
+
+def wrote_recently(request: Request) -> bool:
+    until = request.cookies.get(READ_YOUR_WRITES_COOKIE)
+    return until is not None and until.isdigit() and int(until) >= time.time()
+
+
+async def open_read_session(request: Request) -> AsyncSession:
+    if replica_session_maker is not None and replica_health.available() and not wrote_recently(request):
+        session = replica_session_maker()
+        try:
+            # Соединение берём сразу, чтобы при недоступной реплике успеть уйти на основную базу
+            await session.connection()
+            request.state.db_role = 'replica'
+            return session
+        except (DBAPIError, OSError):
+            replica_health.mark_down()
+            await session.close()
+    request.state.db_role = 'primary'
+    return async_session_maker()
+
+
+@asynccontextmanager
+async def read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    session = await open_read_session(request)
+    async with session:
+        try:
+            yield session
+        except (DBAPIError, OSError):
+            if request.state.db_role == 'replica':
+                replica_health.mark_down()
+            raise
+
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    async with read_session(request) as session:
+        yield session
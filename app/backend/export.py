@@ -0,0 +1,39 @@
+import csv
+import io
+import os
+from typing import AsyncIterator
+
+import orjson
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Строк, которые курсор отдаёт за раз и которые уходят клиенту одним куском
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def encode_ndjson(rows: list[tuple], columns: list[str]) -> bytes:
+    return b''.join(orjson.dumps(dict(zip(columns, row))) + b'\n' for row in rows)
+
+
+def encode_csv(rows: list[tuple], columns: list[str], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def encode_batches(partitions: AsyncIterator[list[tuple]], fmt: str, columns: list[str]) -> AsyncIterator[bytes]:
+    '''Кодирует пачки строк из серверного курсора, в памяти одновременно только одна пачка'''
+    if fmt == 'csv':
+        # Заголовок уходит сразу, даже если первая пачка ещё читается из базы
+        yield encode_csv([], columns, header=True)
+    async for rows in partitions:
+        yield encode_ndjson(rows, columns) if fmt == 'ndjson' else encode_csv(rows, columns)
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import time
+from bisect import bisect_right
+from collections import Counter
+
+from dotenv import load_dotenv
+from sqlalchemy import select, case, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.backend.category_tree import CategoryTree, CategoryNode
+from app.backend.invalidation import invalidation_bus
+from app.models import Product
+
+load_dotenv()
+
+FACETS_TTL = float(os.getenv("FACETS_TTL", 300))
+# Нижние границы ценовых корзин, последняя корзина открыта сверху
+FACET_PRICE_BUCKETS = [int(bound) for bound in os.getenv("FACET_PRICE_BUCKETS", "0,1000,5000,20000,100000").split(',')]
+
+
+def price_bucket(price: int | None, bounds: list[int] = FACET_PRICE_BUCKETS) -> int:
+    return max(bisect_right(bounds, price) - 1, 0) if price is not None else 0
+
+
+class FacetIndex:
+    '''Счётчики активных товаров по (категория, ценовая корзина, в наличии) в памяти процесса.
+
+    Строится одним GROUP BY при первом обращении и по истечении FACETS_TTL, дальше ручки записи
+    товаров сдвигают счётчики после commit, так что запросы фасетов не читают products.
+    '''
+
+    def __init__(self, ttl: float = FACETS_TTL, bounds: list[int] = FACET_PRICE_BUCKETS):
+        self.ttl = ttl
+        self.bounds = sorted(bounds)
+        self.counts: dict[int, Counter] = {}
+        self.loaded_at: float | None = None
+        self.version = 0
+        self._lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    async def ensure_loaded(self, session: AsyncSession) -> 'FacetIndex':
+        if not self.is_fresh():
+            async with self._lock:
+                if not self.is_fresh():
+                    await self.rebuild(session)
+        return self
+
+    async def rebuild(self, session: AsyncSession):
+        version = self.version
+        bucket = case(*((Product.price >= bound, index) for index, bound in reversed(list(enumerate(self.bounds)))),
+                      else_=0)
+        query = select(
+            Product.category_id, bucket.label('bucket'), (Product.stock > 0).label('in_stock'), func.count()
+        ).where(Product.is_active == True).group_by('category_id', 'bucket', 'in_stock')
+        counts: dict[int, Counter] = {}
+        for category_id, bucket_index, in_stock, count in await session.execute(query):
+            counts.setdefault(category_id, Counter())[bucket_index, bool(in_stock)] += count
+        self.counts = counts
+        # Изменение, пришедшее во время загрузки, могло в неё не попасть - тогда перестроимся ещё раз
+        self.loaded_at = time.monotonic() if version == self.version else None
+
+    def invalidate(self):
+        self.loaded_at = None
+        invalidation_bus.publish('facets')
+
+    def move(self, old: tuple | None, new: tuple | None):
+        '''Переносит товар из состояния old в new; состояние - (category_id, price, stock), None - неактивен'''
+        self._shift(old, new)
+        invalidation_bus.publish('facets', None, [old, new])
+
+    def apply_remote(self, _, states: list | None):
+        '''Событие другого воркера: сдвиг счётчиков или, без состояний, пересборка'''
+        if states is None:
+            self.loaded_at = None
+        else:
+            self._shift(*states)
+
+    def _shift(self, old, new):
+        self.version += 1
+        if self.loaded_at is None:
+            return
+        for state, delta in ((old, -1), (new, 1)):
+            if state is not None:
+                category_id, price, stock = state
+                self.counts.setdefault(category_id, Counter())[price_bucket(price, self.bounds), stock > 0] += delta
+
+    def _subtree_counts(self, category_ids: list[int], in_stock: bool) -> Counter:
+        result = Counter()
+        for category_id in category_ids:
+            for (bucket, stocked), count in self.counts.get(category_id, {}).items():
+                if stocked or not in_stock:
+                    result[bucket] += count
+        return result
+
+    def facets(self, tree: CategoryTree, root: CategoryNode | None, in_stock: bool = True) -> dict:
+        '''Число товаров в поддереве root (всём каталоге при None), по дочерним категориям и ценовым корзинам'''
+        children = [tree.get(child) for child in tree.children.get(root.id if root else None, ())]
+        categories = []
+        for child in sorted((child for child in children if child.is_active), key=lambda node: node.name or ''):
+            count = sum(self._subtree_counts(tree.descendant_ids(child.slug), in_stock).values())
+            categories.append({'slug': child.slug, 'name': child.name, 'count': count})
+        if root is not None:
+            prices = self._subtree_counts(tree.descendant_ids(root.slug), in_stock)
+        else:
+            active = [node.id for node in tree.nodes.values() if node.is_active]
+            prices = self._subtree_counts(active, in_stock)
+        upper = self.bounds[1:] + [None]
+        return {
+            'total': sum(prices.values()),
+            'categories': categories,
+            'price': [{'min': bound, 'max': upper[index], 'count': prices[index]}
+                      for index, bound in enumerate(self.bounds)],
+        }
+
+
+facet_index = FacetIndex()
+invalidation_bus.subscribe('facets', facet_index.apply_remote)
+invalidation_bus.on_resync(lambda: facet_index.apply_remote(None, None))
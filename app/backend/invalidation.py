@@ -0,0 +1,261 @@
+import asyncio
+import inspect
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+import orjson
+from dotenv import load_dotenv
+from sqlalchemy import make_url, text
+
+from app.backend.db import DB_URL, engine
+
+load_dotenv()
+
+# postgres - LISTEN/NOTIFY через основную базу, memory - внутри процесса (тесты, один воркер)
+INVALIDATION_TRANSPORT = os.getenv(
+    "INVALIDATION_TRANSPORT", 'postgres' if make_url(DB_URL).get_backend_name() == 'postgresql' else 'memory'
+)
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", 'shop_invalidation')
+# Сколько секунд копить события перед отправкой одним NOTIFY
+INVALIDATION_FLUSH_INTERVAL = float(os.getenv("INVALIDATION_FLUSH_INTERVAL", 0.01))
+INVALIDATION_RECONNECT_DELAY = float(os.getenv("INVALIDATION_RECONNECT_DELAY", 1))
+INVALIDATION_PING_INTERVAL = float(os.getenv("INVALIDATION_PING_INTERVAL", 10))
+# Полезная нагрузка NOTIFY ограничена 8000 байтами; данные одного события должны влезать с запасом на конверт
+NOTIFY_MAX_PAYLOAD = 7900
+EVENT_MAX_DATA = NOTIFY_MAX_PAYLOAD - 200
+# Служебное событие: получатели сбрасывают все локальные кэши
+RESYNC_EVENT = '*resync'
+
+logger = logging.getLogger('app.invalidation')
+
+Deliver = Callable[[str], None]
+
+
+class MemoryTransport:
+    '''Доставка внутри процесса: все шины с общим транспортом видят события друг друга'''
+
+    def __init__(self):
+        self.listeners: list[Deliver] = []
+
+    async def send(self, payload: str):
+        for deliver in list(self.listeners):
+            deliver(payload)
+
+    async def listen(self, deliver: Deliver, on_reconnect: Callable[[], None]):
+        self.listeners.append(deliver)
+        try:
+            await asyncio.Future()
+        finally:
+            self.listeners.remove(deliver)
+
+
+class PostgresTransport:
+    '''NOTIFY через пул основной базы, LISTEN на отдельном соединении asyncpg.
+
+    После обрыва соединение восстанавливается с паузой INVALIDATION_RECONNECT_DELAY, и шина делает
+    полную пересинхронизацию: события, отправленные за время обрыва, до воркера не дошли.
+    '''
+
+    def __init__(self, url: str = DB_URL, channel: str = INVALIDATION_CHANNEL,
+                 reconnect_delay: float = INVALIDATION_RECONNECT_DELAY,
+                 ping_interval: float = INVALIDATION_PING_INTERVAL):
+        self.dsn = make_url(url).set(drivername='postgresql').render_as_string(hide_password=False)
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.ping_interval = ping_interval
+        self.reconnects = 0
+
+    async def send(self, payload: str):
+        async with engine.connect() as conn:
+            await conn.execute(text('SELECT pg_notify(:channel, :payload)'),
+                               {'channel': self.channel, 'payload': payload})
+            await conn.commit()
+
+    async def listen(self, deliver: Deliver, on_reconnect: Callable[[], None]):
+        import asyncpg
+
+        connected_before = False
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(self.channel, lambda _conn, _pid, _channel, payload: deliver(payload))
+                if connected_before:
+                    self.reconnects += 1
+                    on_reconnect()
+                connected_before = True
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), self.ping_interval)
+                    except asyncio.TimeoutError:
+                        # Проверка, что соединение живо: обрыв TCP сам по себе может долго не замечаться
+                        await asyncio.wait_for(conn.execute('SELECT 1'), self.ping_interval)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as exc:
+                logger.warning('invalidation listener disconnected: %s', exc)
+            finally:
+                if conn is not None:
+                    conn.terminate()
+            await asyncio.sleep(self.reconnect_delay)
+
+
+class InvalidationBus:
+    '''Шина инвалидации локальных кэшей между воркерами.
+
+    Ручки записи публикуют компактные события (сущность, id, версия), шина копит их
+    INVALIDATION_FLUSH_INTERVAL и отправляет одним сообщением. Фоновый слушатель в каждом воркере
+    применяет чужие события к своим кэшам. Версия - порядковый номер события у отправителя: пропуск
+    в нумерации, как и переподключение слушателя, приводит к полной пересинхронизации.
+    '''
+
+    def __init__(self, transport, flush_interval: float = INVALIDATION_FLUSH_INTERVAL):
+        self.transport = transport
+        self.flush_interval = flush_interval
+        self.origin = uuid.uuid4().hex[:12]
+        self.handlers: dict[str, Callable[[Any, Any], Awaitable[None] | None]] = {}
+        self.resync_handlers: list[Callable[[], None]] = []
+        self.version = 0
+        self.seen: dict[str, int] = {}
+        self.outbox: list[dict] = []
+        self.published = 0
+        self.received = 0
+        self.resyncs = 0
+        self.send_errors = 0
+        self.max_delay = 0.0
+        self._wakeup = asyncio.Event()
+        self._sender: asyncio.Task | None = None
+        self._listener: asyncio.Task | None = None
+
+    def subscribe(self, entity: str, handler: Callable[[Any, Any], Awaitable[None] | None]):
+        self.handlers[entity] = handler
+
+    def on_resync(self, handler: Callable[[], None]):
+        self.resync_handlers.append(handler)
+
+    def publish(self, entity: str, entity_id: Any = None, data: Any = None):
+        if data is not None and len(orjson.dumps(data)) > EVENT_MAX_DATA:
+            # Длинный список (например, теги чанка импорта) делится на несколько событий,
+            # а то, что не делится, заменяется полной пересинхронизацией
+            if isinstance(data, list) and len(data) > 1:
+                half = len(data) // 2
+                self.publish(entity, entity_id, data[:half])
+                self.publish(entity, entity_id, data[half:])
+            else:
+                self.publish(RESYNC_EVENT)
+            return
+        self.version += 1
+        event = {'e': entity, 'i': entity_id, 'v': self.version, 'o': self.origin, 't': round(time.time(), 3)}
+        if data is not None:
+            event['d'] = data
+        self.outbox.append(event)
+        if not self._running(self._sender):
+            self._start_sender()
+        self._wakeup.set()
+
+    def start(self):
+        self._start_sender()
+        self._listener = asyncio.create_task(self.transport.listen(self._deliver, self.resync))
+
+    async def stop(self):
+        if self._running(self._sender):
+            await self._send_outbox()
+            self._sender.cancel()
+        if self._running(self._listener):
+            self._listener.cancel()
+        self._sender = self._listener = None
+
+    @staticmethod
+    def _running(task: asyncio.Task | None) -> bool:
+        return task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop()
+
+    def _start_sender(self):
+        # Событие привязывается к циклу событий, поэтому на каждый запуск создаётся заново
+        self._wakeup = asyncio.Event()
+        self._sender = asyncio.create_task(self._send_loop())
+
+    async def _send_loop(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            await self._send_outbox()
+
+    async def _send_outbox(self):
+        events, self.outbox = self.outbox, []
+        failed = False
+        for payload in self._payloads(events):
+            try:
+                await self.transport.send(payload)
+            except Exception:
+                # Не повторяем, чтобы не нарушить порядок событий
+                failed = True
+                self.send_errors += 1
+                logger.exception('invalidation events were not sent')
+        self.published += len(events)
+        if failed:
+            # Получатели не должны ждать следующего события, чтобы заметить пропуск: сразу просим пересинхронизацию
+            self.version += 1
+            notice = {'e': RESYNC_EVENT, 'i': None, 'v': self.version, 'o': self.origin, 't': round(time.time(), 3)}
+            try:
+                await self.transport.send(orjson.dumps([notice]).decode())
+            except Exception:
+                self.send_errors += 1
+                logger.exception('invalidation resync notice was not sent')
+
+    @staticmethod
+    def _payloads(events: list[dict]):
+        batch, size = [], 2
+        for event in events:
+            encoded = orjson.dumps(event)
+            if batch and size + len(encoded) + 1 > NOTIFY_MAX_PAYLOAD:
+                yield (b'[' + b','.join(batch) + b']').decode()
+                batch, size = [], 2
+            batch.append(encoded)
+            size += len(encoded) + 1
+        if batch:
+            yield (b'[' + b','.join(batch) + b']').decode()
+
+    def _deliver(self, payload: str):
+        for event in orjson.loads(payload):
+            origin = event['o']
+            if origin == self.origin:
+                continue
+            last = self.seen.get(origin)
+            self.seen[origin] = event['v']
+            self.received += 1
+            if event['e'] == RESYNC_EVENT or (last is not None and event['v'] != last + 1):
+                self.resync()
+                if event['e'] == RESYNC_EVENT:
+                    continue
+            self.max_delay = max(self.max_delay, time.time() - event['t'])
+            handler = self.handlers.get(event['e'])
+            if handler is not None:
+                result = handler(event['i'], event.get('d'))
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+
+    def resync(self):
+        '''Сбрасывает все локальные кэши: их заново наполнят обычные запросы'''
+        self.resyncs += 1
+        for handler in self.resync_handlers:
+            handler()
+
+    def stats(self) -> dict:
+        return {
+            'transport': type(self.transport).__name__,
+            'origin': self.origin,
+            'published': self.published,
+            'pending': len(self.outbox),
+            'received': self.received,
+            'resyncs': self.resyncs,
+            'send_errors': self.send_errors,
+            'max_delay': round(self.max_delay, 4),
+            'listening': self._listener is not None and not self._listener.done(),
+        }
+
+
+invalidation_bus = InvalidationBus(PostgresTransport() if INVALIDATION_TRANSPORT == 'postgres' else MemoryTransport())
@@ -0,0 +1,77 @@
+"""Read model product_listing: обновление из products и пересборка с нуля.
+
+Пересборка после сбоя или ручной правки таблиц:
+
+    python -m app.backend.listing
+"""
+import asyncio
+import time
+
+from sqlalchemy import String, and_, cast, delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.models import Category, Product, ProductListing
+
+LISTING_COLUMNS = [column.name for column in ProductListing.__table__.columns]
+
+
+def category_paths():
+    '''Рекурсивный CTE: путь /корень/.../категория/ и активность всей цепочки для каждой категории'''
+    paths = select(
+        Category.id,
+        (literal('/') + cast(Category.id, String) + '/').label('path'),
+        func.coalesce(Category.is_active, False).label('active'),
+    ).where(Category.parent_id == None).cte('category_paths', recursive=True)
+    parent = paths.alias('parent')
+    return paths.union_all(select(
+        Category.id,
+        parent.c.path + cast(Category.id, String) + '/',
+        and_(parent.c.active, func.coalesce(Category.is_active, False)),
+    ).where(Category.parent_id == parent.c.id))
+
+
+def listing_rows(*where):
+    '''Строки product_listing, вычисленные из products для товаров, подходящих под where'''
+    paths = category_paths()
+    listed = and_(func.coalesce(Product.is_active, False), func.coalesce(paths.c.active, False))
+    return select(
+        Product.id, func.coalesce(Product.name, ''), Product.slug, Product.description,
+        func.coalesce(Product.price, 0), Product.image_url, Product.stock, func.coalesce(Product.rating, 0.0),
+        Product.review_count, Product.is_active, Product.category_id, Product.user_id, paths.c.path, listed,
+    ).outerjoin(paths, paths.c.id == Product.category_id).where(*where)
+
+
+def refresh_listing(dialect: str, *where):
+    '''INSERT ... SELECT ... ON CONFLICT: пересчитывает строки read model для товаров под where.
+
+    Вызывается в транзакции записи товара, поэтому листинг меняется атомарно с products.
+    '''
+    dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    query = dialect_insert(ProductListing).from_select(LISTING_COLUMNS, listing_rows(*where))
+    return query.on_conflict_do_update(
+        index_elements=[ProductListing.id],
+        set_={name: query.excluded[name] for name in LISTING_COLUMNS if name != 'id'},
+    )
+
+
+async def rebuild_listing(conn: AsyncConnection) -> int:
+    '''Заполняет product_listing заново по всем товарам'''
+    await conn.execute(delete(ProductListing))
+    await conn.execute(insert(ProductListing).from_select(LISTING_COLUMNS, listing_rows()))
+    return await conn.scalar(select(func.count()).select_from(ProductListing))
+
+
+async def main(db_engine: AsyncEngine | None = None) -> int:
+    if db_engine is None:
+        from app.backend.db import engine as db_engine
+    started = time.perf_counter()
+    async with db_engine.begin() as conn:
+        rows = await rebuild_listing(conn)
+    print(f'product_listing: {rows} rows rebuilt in {time.perf_counter() - started:.1f}s')
+    await db_engine.dispose()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(asyncio.run(main()))
@@ -0,0 +1,41 @@
+import base64
+import json
+import os
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+load_dotenv()
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 200))
+# Сколько товаров можно запросить одним батчем по slug или id
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 100))
+
+
+def encode_cursor(*values) -> str:
+    '''Упаковывает ключ последней строки страницы в непрозрачную строку'''
+    raw = json.dumps(values, separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    return values
+
+
+def parse_fields(fields: str | None, allowed: dict) -> list:
+    '''Возвращает колонки для проекции fields=a,b,c (все разрешённые, если fields не задан)'''
+    if not fields:
+        return list(allowed.values())
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown fields: {', '.join(unknown)}")
+    return [allowed[name] for name in dict.fromkeys(names)]
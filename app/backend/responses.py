@@ -0,0 +1,66 @@
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+import orjson
+from fastapi import Request, status
+from fastapi.responses import Response
+
+from app.backend.timing import current_timing, add_serialization
+
+
+class FastJSONResponse(Response):
+    '''Сериализует строки результата напрямую в байты через orjson.
+
+    Возврат Response из обработчика пропускает jsonable_encoder и валидацию
+    response_model, поэтому сюда передаются уже готовые dict/list из строк запроса.
+    Готовые байты (например, тело из кэша) отдаются как есть.
+    '''
+    media_type = 'application/json'
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def dumps(content) -> bytes:
+    if current_timing() is None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    started = time.perf_counter()
+    body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    add_serialization(time.perf_counter() - started)
+    return body
+
+
+def etag_for(body: bytes) -> str:
+    '''Сильный ETag по содержимому: одинаковый у всех воркеров для одинакового тела'''
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def not_modified(request: Request, etag: str, modified: float) -> bool:
+    '''Проверяет If-None-Match, а без него - If-Modified-Since (точность - секунда)'''
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        # Для GET сравнение слабое: W/"x" совпадает с "x"
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag.removeprefix('W/') in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # Last-Modified точен до секунды: две версии, собранные в одну секунду, с ним неотличимы.
+        # Поэтому 304 только если тело собрано в секунду строго раньше даты клиента
+        return int(modified) < since
+    return False
+
+
+def conditional_response(request: Request, body: bytes, etag: str, modified: float) -> Response:
+    '''200 с телом и валидаторами или 304 без тела, если у клиента та же версия'''
+    # no-cache: клиент хранит ответ, но перед использованием переспрашивает сервер
+    headers = {'ETag': etag, 'Last-Modified': formatdate(int(modified), usegmt=True), 'Cache-Control': 'no-cache'}
+    if not_modified(request, etag, modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FastJSONResponse(body, headers=headers)
@@ -0,0 +1,78 @@
+import os
+import re
+
+from dotenv import load_dotenv
+from sqlalchemy import DDL, event, func, literal_column, select, table, column
+
+from app.models import Product
+
+load_dotenv()
+
+# Конфигурация полнотекстового поиска Postgres; simple не стеммит и одинаково работает для любого языка
+SEARCH_CONFIG = os.getenv("SEARCH_CONFIG", 'simple')
+# Сколько слов запроса учитывать; короче этого префикс не ищется, чтобы не перебирать пол-индекса
+SEARCH_MAX_TERMS = 8
+SEARCH_MIN_PREFIX = 2
+
+TERM_RE = re.compile(r'\w+')
+
+# Индекс для SQLite: FTS5-таблица поверх products, её поддерживают триггеры на запись товаров
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, description, content='products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+]
+
+# Индекс для Postgres: генерируемая колонка tsvector (имя весит больше описания) и GIN по ней
+POSTGRES_SEARCH_DDL = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_products_search ON products USING gin (search_vector)",
+]
+
+# Префиксы имён объектов индекса (включая служебные таблицы FTS5): их нет в моделях,
+# и alembic autogenerate не должен предлагать их удалить
+SEARCH_OBJECTS = ('products_fts', 'search_vector', 'ix_products_search')
+
+# create_all (бенчмарки, локальные базы) создаёт индекс вместе с таблицей, миграция - на существующих базах
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Product.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_SEARCH_DDL:
+    event.listen(Product.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+products_fts = table('products_fts', column('rowid'))
+
+
+def search_terms(q: str) -> list[str]:
+    return TERM_RE.findall(q.lower())[:SEARCH_MAX_TERMS]
+
+
+def search_query(dialect: str, terms: list[str], columns: list):
+    '''Запрос по индексу: все слова обязательны, последнее - как префикс (автодополнение).
+
+    Возвращает select и выражение сортировки по релевантности.
+    '''
+    prefix = len(terms[-1]) >= SEARCH_MIN_PREFIX
+    if dialect == 'postgresql':
+        # Слова - только \w+, спецсимволов tsquery в них нет
+        tsquery = func.to_tsquery(SEARCH_CONFIG, ' & '.join(terms[:-1] + [terms[-1] + (':*' if prefix else '')]))
+        vector = literal_column('products.search_vector')
+        rank = func.ts_rank_cd(vector, tsquery)
+        return select(*columns).where(vector.op('@@')(tsquery)), rank.desc()
+    match = ' '.join(f'"{term}"' for term in terms) + ('*' if prefix else '')
+    # bm25 тем меньше, чем выше релевантность; имя весит в 10 раз больше описания
+    rank = func.bm25(literal_column('products_fts'), 10.0, 1.0)
+    query = select(*columns).join(products_fts, products_fts.c.rowid == Product.id).where(
+        literal_column('products_fts').op('MATCH')(match)
+    )
+    return query, rank
@@ -0,0 +1,62 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, TypeVar
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+load_dotenv()
+
+# Сколько секунд запрос ждёт общий результат, прежде чем получить 503
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", 10))
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    '''Склеивает одновременные одинаковые чтения в один запрос к базе.
+
+    Загрузка выполняется отдельной задачей, а все вызывающие, включая первого, ждут её
+    через shield: отмена одного клиента не прерывает запрос для остальных.
+    '''
+
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self.flights: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    async def do(self, key: str, loader: Callable[[], Awaitable[T]]) -> T:
+        task = self.flights.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.create_task(loader())
+            self.flights[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail='Service is busy, try again later', headers={'Retry-After': '1'})
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self.flights.get(key) is task:
+            del self.flights[key]
+        if not task.cancelled():
+            # Ошибку уже получили ожидающие; если их не осталось, не даём asyncio ругаться в лог
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self.flights),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts,
+        }
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+load_dotenv()
+
+# Выключено по умолчанию: без флага не ставятся ни middleware, ни хуки движка
+REQUEST_TIMING = os.getenv("REQUEST_TIMING") == 'True'
+# Порог медленного запроса к БД в миллисекундах, 0 - не логировать
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 0))
+TIMING_LOG_LEVEL = os.getenv("TIMING_LOG_LEVEL", 'INFO').upper()
+SLOW_QUERY_MAX_SQL = 4000
+
+logger = logging.getLogger('app.timing')
+
+
+class RequestTiming:
+    __slots__ = ('started', 'statements', 'db', 'pool_wait', 'serialization')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db = 0.0
+        self.pool_wait = 0.0
+        self.serialization = 0.0
+
+    def server_timing(self, total: float) -> str:
+        return (f'db;dur={self.db * 1000:.1f};desc="{self.statements} queries", '
+                f'pool;dur={self.pool_wait * 1000:.1f}, '
+                f'ser;dur={self.serialization * 1000:.1f}, '
+                f'app;dur={total * 1000:.1f}')
+
+
+_current: ContextVar[RequestTiming | None] = ContextVar('request_timing', default=None)
+
+
+def current_timing() -> RequestTiming | None:
+    return _current.get()
+
+
+def add_pool_wait(seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.pool_wait += seconds
+
+
+def add_serialization(seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.serialization += seconds
+
+
+def parameter_types(parameters, executemany: bool):
+    '''Типы параметров запроса без значений: в параметрах бывают пароли, хэши и email'''
+    row = parameters[0] if executemany and parameters else parameters
+    if isinstance(row, dict):
+        return {name: type(value).__name__ for name, value in row.items()}
+    return [type(value).__name__ for value in row or ()]
+
+
+def ensure_log_handler():
+    '''Запасной вывод в stderr, если логирование никто не настроил.
+
+    Конфиг uvicorn по умолчанию настраивает только свои логгеры: без обработчика у корня строки INFO
+    из app.timing терялись бы. Если обработчики уже есть (свой log config), ничего не меняется.
+    '''
+    if logger.handlers or logging.getLogger().handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(levelname)s:     %(name)s %(message)s'))
+    logger.addHandler(handler)
+    if logger.level == logging.NOTSET:
+        logger.setLevel(TIMING_LOG_LEVEL)
+
+
+def instrument_engine(db_engine: AsyncEngine):
+    if not REQUEST_TIMING and not SLOW_QUERY_MS:
+        return
+    ensure_log_handler()
+
+    @event.listens_for(db_engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(db_engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        timing = _current.get()
+        if timing is not None:
+            timing.statements += 1
+            timing.db += elapsed
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            logger.warning(json.dumps({
+                'event': 'slow_query',
+                'duration_ms': round(elapsed * 1000, 2),
+                'sql': ' '.join(statement.split())[:SLOW_QUERY_MAX_SQL],
+                'parameter_types': parameter_types(parameters, executemany),
+                'executemany': executemany,
+            }, ensure_ascii=False))
+
+
+class TimingMiddleware:
+    '''Собирает тайминги запроса и отдаёт их в Server-Timing и в лог одной JSON-строкой.
+
+    Если запрос уже обрабатывается внешним экземпляром (app -> смонтированный app_v1),
+    внутренний просто пропускает его дальше.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or _current.get() is not None:
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                header = timing.server_timing(time.perf_counter() - timing.started)
+                message['headers'] = [*message.get('headers', []), (b'server-timing', header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            state = scope.get('state') or {}
+            logger.info(json.dumps({
+                'event': 'request',
+                'method': scope['method'],
+                'path': scope['path'],
+                'status': status_code,
+                'duration_ms': round((time.perf_counter() - timing.started) * 1000, 2),
+                'db_ms': round(timing.db * 1000, 2),
+                'db_statements': timing.statements,
+                'pool_wait_ms': round(timing.pool_wait * 1000, 2),
+                'serialization_ms': round(timing.serialization * 1000, 2),
+                'db_role': state.get('db_role'),
+            }))
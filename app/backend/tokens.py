@@ -0,0 +1,111 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+import orjson
+from dotenv import load_dotenv
+
+from app.backend.invalidation import invalidation_bus
+
+load_dotenv()
+
+# memory - в памяти процесса, redis - общий для всех воркеров (нужен пакет redis, адрес в CACHE_URL)
+TOKEN_STORE_BACKEND = os.getenv("TOKEN_STORE_BACKEND", 'memory')
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10_000))
+# Сколько помнить отзыв: не меньше времени жизни access token
+TOKEN_REVOCATION_TTL = int(os.getenv("TOKEN_REVOCATION_TTL", 30 * 60))
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class MemoryTokenStore:
+    '''Проверенные токены (LRU до истечения exp) и отзывы: id пользователя -> минимальный iat'''
+
+    shared = False
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE, revocation_ttl: int = TOKEN_REVOCATION_TTL):
+        self.max_entries = max_entries
+        self.revocation_ttl = revocation_ttl
+        self.claims: OrderedDict[str, dict] = OrderedDict()
+        self.revoked: dict[int, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_claims(self, digest: str) -> dict | None:
+        claims = self.claims.get(digest)
+        if claims is None or claims['exp'] <= time.time():
+            self.claims.pop(digest, None)
+            self.misses += 1
+            return None
+        self.claims.move_to_end(digest)
+        self.hits += 1
+        return claims
+
+    async def set_claims(self, digest: str, claims: dict):
+        self.claims[digest] = claims
+        self.claims.move_to_end(digest)
+        while len(self.claims) > self.max_entries:
+            self.claims.popitem(last=False)
+
+    async def revoke(self, user_id: int, issued_before: float):
+        self.revoked[user_id] = issued_before
+        # Отзывы старше времени жизни токена уже ничего не отсекают
+        horizon = time.time() - self.revocation_ttl
+        for stale_id in [key for key, value in self.revoked.items() if value < horizon]:
+            del self.revoked[stale_id]
+
+    async def min_issued_at(self, user_id: int) -> float | None:
+        return self.revoked.get(user_id)
+
+    def stats(self) -> dict:
+        return {'backend': 'memory', 'tokens': len(self.claims), 'revoked_users': len(self.revoked),
+                'hits': self.hits, 'misses': self.misses}
+
+
+class RedisTokenStore:
+    '''То же в Redis: отзыв, сделанный одним воркером, сразу виден остальным'''
+
+    shared = True
+
+    def __init__(self, url: str = os.getenv("CACHE_URL", 'redis://localhost:6379/0'),
+                 prefix: str = 'shop:auth:', revocation_ttl: int = TOKEN_REVOCATION_TTL):
+        from redis import asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self.revocation_ttl = revocation_ttl
+
+    async def get_claims(self, digest: str) -> dict | None:
+        value = await self.client.get(self.prefix + 'token:' + digest)
+        return orjson.loads(value) if value is not None else None
+
+    async def set_claims(self, digest: str, claims: dict):
+        await self.client.set(self.prefix + 'token:' + digest, orjson.dumps(claims), exat=int(claims['exp']))
+
+    async def revoke(self, user_id: int, issued_before: float):
+        await self.client.set(f'{self.prefix}revoked:{user_id}', issued_before, ex=self.revocation_ttl)
+
+    async def min_issued_at(self, user_id: int) -> float | None:
+        value = await self.client.get(f'{self.prefix}revoked:{user_id}')
+        return float(value) if value is not None else None
+
+    def stats(self) -> dict:
+        return {'backend': 'redis'}
+
+
+token_store = RedisTokenStore() if TOKEN_STORE_BACKEND == 'redis' else MemoryTokenStore()
+
+
+async def revoke_user_tokens(user_id: int):
+    '''Все токены пользователя, выданные до этого момента, перестают приниматься'''
+    issued_before = time.time()
+    await token_store.revoke(user_id, issued_before)
+    if not token_store.shared:
+        invalidation_bus.publish('user', user_id, issued_before)
+
+
+if not token_store.shared:
+    invalidation_bus.subscribe('user', token_store.revoke)
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Сколько секунд копить задачи перед сбросом, сколько ключей сбрасывать одним пакетом
+JOBS_FLUSH_INTERVAL = float(os.getenv("JOBS_FLUSH_INTERVAL", 0.05))
+JOBS_BATCH_SIZE = int(os.getenv("JOBS_BATCH_SIZE", 500))
+# Повторы упавшего пакета: пауза JOBS_RETRY_BACKOFF * 2**n, после JOBS_MAX_RETRIES пакет отбрасывается
+JOBS_MAX_RETRIES = int(os.getenv("JOBS_MAX_RETRIES", 5))
+JOBS_RETRY_BACKOFF = float(os.getenv("JOBS_RETRY_BACKOFF", 0.1))
+# Сколько секунд остановка ждёт, пока очередь досбросится
+JOBS_DRAIN_TIMEOUT = float(os.getenv("JOBS_DRAIN_TIMEOUT", 10))
+
+logger = logging.getLogger('app.write_behind')
+
+Handler = Callable[[dict[Hashable, Any]], Awaitable[Any]]
+After = Callable[[Any], Awaitable[None]]
+
+
+def keep_last(old, new):
+    return new
+
+
+class WriteBehindQueue:
+    '''Очередь побочных эффектов записи, которые не должны держать ответ на запрос.
+
+    Задачи одного вида склеиваются по ключу (например, id товара) функцией merge, а обработчик
+    получает сразу пачку ключей и пишет её общими запросами. Упавшая пачка повторяется с
+    экспоненциальной паузой, поэтому обработчик - это одна транзакция, которую безопасно повторить.
+    Побочные эффекты после commit (сброс кэша) выполняет after с результатом обработчика: один раз,
+    вне повторов, а его ошибки только логируются. Очередь живёт в памяти процесса: lifespan запускает её и при остановке
+    досбрасывает, а задачи, не сброшенные из-за падения воркера, теряются.
+    '''
+
+    def __init__(self, flush_interval: float = JOBS_FLUSH_INTERVAL, batch_size: int = JOBS_BATCH_SIZE,
+                 max_retries: int = JOBS_MAX_RETRIES, retry_backoff: float = JOBS_RETRY_BACKOFF):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.handlers: dict[str, tuple[Handler, Callable, After | None]] = {}
+        self.pending: dict[str, dict[Hashable, Any]] = {}
+        self.enqueued_at: dict[tuple[str, Hashable], float] = {}
+        self.enqueued = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        self.after_errors = 0
+        self.last_lag = 0.0
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+        self._task: asyncio.Task | None = None
+
+    def register(self, kind: str, handler: Handler, merge: Callable = keep_last, after: After | None = None):
+        self.handlers[kind] = (handler, merge, after)
+
+    def enqueue(self, kind: str, key: Hashable, payload: Any = None):
+        _, merge, _ = self.handlers[kind]
+        jobs = self.pending.setdefault(kind, {})
+        if key in jobs:
+            jobs[key] = merge(jobs[key], payload)
+            self.coalesced += 1
+        else:
+            jobs[key] = payload
+            self.enqueued_at[kind, key] = time.monotonic()
+        self.enqueued += 1
+        self._idle.clear()
+        self._wakeup.set()
+        # Без lifespan (например, в ASGITransport) воркер поднимается при первой задаче
+        if not self.running():
+            self.start()
+
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() \
+            and self._task.get_loop() is asyncio.get_running_loop()
+
+    def start(self):
+        # События привязываются к циклу событий, поэтому на каждый запуск создаются заново
+        self._wakeup, self._idle = asyncio.Event(), asyncio.Event()
+        if self.depth():
+            self._wakeup.set()
+        else:
+            self._idle.set()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = JOBS_DRAIN_TIMEOUT):
+        '''Досбрасывает очередь и останавливает воркер'''
+        if not self.running():
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error('write-behind queue stopped with %d pending jobs', self.depth())
+        self._task = None
+
+    async def join(self):
+        '''Ждёт, пока всё поставленное в очередь будет сброшено'''
+        if self.running():
+            await self._idle.wait()
+
+    def depth(self) -> int:
+        return sum(len(jobs) for jobs in self.pending.values())
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if not self._closing:
+                # Короткая пауза, чтобы задачи по одним и тем же ключам успели склеиться
+                await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            await self._flush()
+            if not self.depth():
+                self._idle.set()
+                if self._closing:
+                    return
+
+    async def _flush(self):
+        for kind in list(self.pending):
+            jobs = self.pending[kind]
+            while jobs:
+                keys = list(jobs)[:self.batch_size]
+                batch = {key: jobs.pop(key) for key in keys}
+                started = [self.enqueued_at.pop((kind, key)) for key in keys]
+                await self._process(kind, batch)
+                self.last_lag = time.monotonic() - min(started)
+
+    async def _process(self, kind: str, batch: dict):
+        handler, _, after = self.handlers[kind]
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await handler(batch)
+            except Exception:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    logger.exception('write-behind %s batch of %d jobs dropped', kind, len(batch))
+                    return
+                self.retries += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+            else:
+                self.processed += len(batch)
+                self.batches += 1
+                break
+        if after is not None:
+            # Транзакция уже закоммичена: повтор обработчика применил бы сдвиги второй раз
+            try:
+                await after(result)
+            except Exception:
+                self.after_errors += 1
+                logger.exception('write-behind %s after-commit step failed', kind)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            'depth': self.depth(),
+            'oldest_pending_age': round(now - min(self.enqueued_at.values()), 4) if self.enqueued_at else 0.0,
+            'last_flush_lag': round(self.last_lag, 4),
+            'enqueued': self.enqueued,
+            'coalesced': self.coalesced,
+            'processed': self.processed,
+            'batches': self.batches,
+            'retries': self.retries,
+            'failed': self.failed,
+            'after_errors': self.after_errors,
+            'running': self._task is not None and not self._task.done(),
+        }
+
+
+write_behind = WriteBehindQueue()
@@ -1,8 +1,39 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
-from app.routers import category, products, auth, permission, review
+from fastapi import FastAPI, Request
+from sqlalchemy.exc import DBAPIError
 
-app = FastAPI()
+from app.backend.db import engine, replica_engine, replica_health, warm_up_pool
+from app.backend.compression import CompressionMiddleware
+from app.backend.db_depends import remember_write
+from app.backend.hashing import password_hasher
+from app.backend.invalidation import invalidation_bus
+from app.backend.timing import REQUEST_TIMING, TimingMiddleware, instrument_engine
+from app.backend.write_behind import write_behind
+from app.routers import category, products, auth, permission, review, metrics, cart, orders
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up_pool()
+    if replica_engine is not None:
+        try:
+            await warm_up_pool(replica_engine)
+        except (DBAPIError, OSError):
+            replica_health.mark_down()
+    write_behind.start()
+    invalidation_bus.start()
+    yield
+    # Сначала досбрасываем отложенные записи и события, пока пул соединений ещё открыт
+    await write_behind.stop()
+    await invalidation_bus.stop()
+    password_hasher.shutdown()
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 app_v1 = FastAPI(title='API v1')
 
 
@@ -10,9 +41,34 @@ app_v1 = FastAPI(title='API v1')
 async def root():
     return {"message": "Hello World"}
 
+app.include_router(metrics.router)
+
+instrument_engine(engine)
+if replica_engine is not None:
+    instrument_engine(replica_engine)
+if REQUEST_TIMING:
+    app.add_middleware(TimingMiddleware)
+    app_v1.add_middleware(TimingMiddleware)
+
+
+@app_v1.middleware('http')
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    if replica_engine is not None and request.method not in ('GET', 'HEAD', 'OPTIONS') \
+            and response.status_code < 400:
+        remember_write(response)
+    return response
+
+
+# Сжатие только у API, снаружи остальных middleware; мелкие ответы ручек записи не доходят до порога
+app_v1.add_middleware(CompressionMiddleware)
+
+
 app_v1.include_router(category.router)
 app_v1.include_router(products.router)
 app_v1.include_router(auth.router)
 app_v1.include_router(permission.router)
 app_v1.include_router(review.router)
-app.mount(path='/v1', app=app_v1)
\ No newline at end of file
+app_v1.include_router(cart.router)
+app_v1.include_router(orders.router)
+app.mount(path='/v1', app=app_v1)
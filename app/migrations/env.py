@@ -24,9 +24,15 @@ config.set_main_option("sqlalchemy.url", DB_URL)
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from app.models.base import Base
+from app.backend.search import SEARCH_OBJECTS
 
 target_metadata = Base.metadata
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Поисковый индекс создаётся отдельным DDL (app/backend/search.py), в моделях его нет
+    return not (name or '').startswith(SEARCH_OBJECTS)
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -49,6 +55,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -58,7 +65,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,49 @@
+"""Product search index
+
+Revision ID: 5b0e7c2d9a41
+Revises: 244ae81adc56
+Create Date: 2026-10-18 10:12:40.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.backend.search import SQLITE_SEARCH_DDL, POSTGRES_SEARCH_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b0e7c2d9a41'
+down_revision: Union[str, None] = '244ae81adc56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        column, index = POSTGRES_SEARCH_DDL
+        # Генерируемая колонка заполняется для всех строк сразу при добавлении
+        op.execute(column)
+        # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+        with op.get_context().autocommit_block():
+            op.execute(index.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY'))
+    elif dialect == 'sqlite':
+        for statement in SQLITE_SEARCH_DDL:
+            op.execute(statement)
+        # Наполняем индекс уже существующими товарами
+        op.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_products_search')
+        op.execute('ALTER TABLE products DROP COLUMN IF EXISTS search_vector')
+    elif dialect == 'sqlite':
+        for trigger in ('products_fts_insert', 'products_fts_delete', 'products_fts_update'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS products_fts')
@@ -0,0 +1,55 @@
+"""Product rating aggregates
+
+Revision ID: 98d6f21e5623
+Revises: 08415ff9f2ed
+Create Date: 2026-10-18 12:10:41.384127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '98d6f21e5623'
+down_revision: Union[str, None] = '08415ff9f2ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.add_column(sa.Column('review_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('grade_sum', sa.Integer(), server_default='0', nullable=False))
+        batch_op.alter_column('rating', existing_type=sa.Integer(), type_=sa.Float())
+
+    # Разовый пересчёт агрегатов по уже существующим отзывам
+    if sa.inspect(op.get_bind()).has_table('reviews'):
+        op.execute("""
+            UPDATE products
+            SET review_count = stats.review_count,
+                grade_sum = stats.grade_sum
+            FROM (
+                SELECT product_id, count(*) AS review_count, sum(grade) AS grade_sum
+                FROM reviews
+                WHERE is_active = true
+                GROUP BY product_id
+            ) AS stats
+            WHERE products.id = stats.product_id
+        """)
+    op.execute("""
+        UPDATE products
+        SET rating = CASE WHEN review_count > 0
+                          THEN round(CAST(grade_sum * 1.0 / review_count AS NUMERIC), 1)
+                          ELSE 0 END
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.alter_column('rating', existing_type=sa.Float(), type_=sa.Integer())
+        batch_op.drop_column('grade_sum')
+        batch_op.drop_column('review_count')
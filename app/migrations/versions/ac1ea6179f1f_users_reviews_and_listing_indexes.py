@@ -0,0 +1,86 @@
+"""Users, reviews and listing indexes
+
+Revision ID: ac1ea6179f1f
+Revises: 98d6f21e5623
+Create Date: 2026-10-18 13:02:17.552908
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ac1ea6179f1f'
+down_revision: Union[str, None] = '98d6f21e5623'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя, таблица, колонки) частичных индексов WHERE is_active под запросы роутеров
+PARTIAL_INDEXES = [
+    ('ix_products_category_listing', 'products', ['category_id', 'name', 'id']),
+    ('ix_products_listing', 'products', ['name', 'id']),
+    ('ix_reviews_product_feed', 'reviews', ['product_id', 'creation_date', 'id']),
+    ('ix_reviews_feed', 'reviews', ['creation_date', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблицы, которые есть в app/models, но не попали в начальную миграцию.
+    # На базах, где их уже создали вручную или через create_all, шаги пропускаются.
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('users'):
+        op.create_table('users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('first_name', sa.String(), nullable=True),
+        sa.Column('last_name', sa.String(), nullable=True),
+        sa.Column('username', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('hashed_password', sa.String(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('is_admin', sa.Boolean(), nullable=True),
+        sa.Column('is_supplier', sa.Boolean(), nullable=True),
+        sa.Column('is_customer', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_users')),
+        sa.UniqueConstraint('email', name=op.f('uq_users_email')),
+        sa.UniqueConstraint('username', name=op.f('uq_users_username'))
+        )
+        op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+
+    if 'user_id' not in {column['name'] for column in inspector.get_columns('products')}:
+        with op.batch_alter_table('products') as batch_op:
+            batch_op.add_column(sa.Column('user_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(op.f('fk_products_user_id_users'), 'users', ['user_id'], ['id'])
+
+    if not inspector.has_table('reviews'):
+        op.create_table('reviews',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('comment', sa.String(), nullable=True),
+        sa.Column('creation_date', sa.DateTime(), nullable=True),
+        sa.Column('grade', sa.Integer(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], name=op.f('fk_reviews_product_id_products')),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_reviews_user_id_users')),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_reviews'))
+        )
+        op.create_index(op.f('ix_reviews_id'), 'reviews', ['id'], unique=False)
+
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in PARTIAL_INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_where=sa.text('is_active'), sqlite_where=sa.text('is_active = 1'),
+                            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Убираются только индексы. users, reviews и products.user_id upgrade создаёт лишь там, где их ещё нет,
+    # а на базах после create_all они старше этой ревизии - удалять их значило бы стереть пользователей и отзывы
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(PARTIAL_INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
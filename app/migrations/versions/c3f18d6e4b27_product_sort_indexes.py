@@ -0,0 +1,41 @@
+"""Product sort indexes
+
+Revision ID: c3f18d6e4b27
+Revises: 5b0e7c2d9a41
+Create Date: 2026-10-18 16:41:05.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f18d6e4b27'
+down_revision: Union[str, None] = '5b0e7c2d9a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Частичные индексы WHERE is_active под сортировку общего листинга по цене и рейтингу
+PARTIAL_INDEXES = [
+    ('ix_products_price_listing', 'products', ['price', 'id']),
+    ('ix_products_rating_listing', 'products', ['rating', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in PARTIAL_INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_where=sa.text('is_active'), sqlite_where=sa.text('is_active = 1'),
+                            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(PARTIAL_INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
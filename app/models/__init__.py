@@ -1,5 +1,8 @@
 from .base import Base
 from .category import Category
 from .products import Product
+from .listing import ProductListing
 from .user import User
-from .review import Review
\ No newline at end of file
+from .review import Review, ReviewGradeCount
+from .cart import CartItem
+from .order import Order, OrderItem
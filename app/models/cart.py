@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, ForeignKey, UniqueConstraint
+
+from app.models.base import Base
+
+
+class CartItem(Base):
+    __tablename__ = 'cart_items'
+
+    id = Column(Integer, primary_key=True, index=True)
+    quantity = Column(Integer, nullable=False)
+
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+
+    # Одна строка на товар в корзине пользователя; индекс заодно обслуживает выборку корзины по user_id
+    __table_args__ = (
+        UniqueConstraint(user_id, product_id),
+    )
@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, Index, text
+
+from app.models.base import Base
+
+
+class ProductListing(Base):
+    '''Денормализованная копия товара для листингов: колонки ProductOut, путь категории и флаг видимости.
+
+    listed - товар активен и активна вся цепочка его категорий. Обновляется ручками записи
+    в той же транзакции, что и products; пересборка с нуля - python -m app.backend.listing.
+    '''
+    __tablename__ = 'product_listing'
+
+    id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    # Колонки сортировок не NULL: строка с NULL не проходит keyset-сравнение (колонка, id) > (...)
+    # и выпадала бы из постраничной выдачи; listing_rows подставляет '', 0 и 0.0
+    name = Column(String(50), nullable=False)
+    slug = Column(String)
+    description = Column(String)
+    price = Column(Integer, nullable=False)
+    image_url = Column(String)
+    stock = Column(Integer)
+    rating = Column(Float, nullable=False)
+    review_count = Column(Integer, nullable=False, default=0, server_default='0')
+    is_active = Column(Boolean)
+    category_id = Column(Integer)
+    user_id = Column(Integer)
+    # /id корня/.../id категории/ - поддерево категории выбирается диапазоном по префиксу.
+    # На PostgreSQL побайтовое сравнение (collation C): локальные правила сортировки пропускают '/'
+    category_path = Column(String().with_variant(String(collation='C'), 'postgresql'))
+    listed = Column(Boolean, nullable=False, default=False, server_default=text('false'))
+
+    # Частичные индексы по видимым товарам под сортировки листингов
+    __table_args__ = (
+        Index('ix_product_listing_category', category_path, name, id,
+              postgresql_where=text('listed'), sqlite_where=text('listed = 1')),
+        Index('ix_product_listing_name', name, id,
+              postgresql_where=text('listed'), sqlite_where=text('listed = 1')),
+        Index('ix_product_listing_price', price, id,
+              postgresql_where=text('listed'), sqlite_where=text('listed = 1')),
+        Index('ix_product_listing_rating', rating, id,
+              postgresql_where=text('listed'), sqlite_where=text('listed = 1')),
+    )
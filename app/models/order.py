@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy.orm import relationship
+
+from app.models.base import Base
+
+
+class Order(Base):
+    __tablename__ = 'orders'
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, nullable=False, default='created')
+    total = Column(Integer, nullable=False)
+    creation_date = Column(DateTime, default=datetime.now)
+
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    items = relationship('OrderItem', back_populates='order')
+
+
+class OrderItem(Base):
+    __tablename__ = 'order_items'
+
+    id = Column(Integer, primary_key=True, index=True)
+    quantity = Column(Integer, nullable=False)
+    # Цена на момент оформления, товар потом может подорожать
+    price = Column(Integer, nullable=False)
+
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
+    order = relationship('Order', back_populates='items')
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
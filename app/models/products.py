@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, Index, text
 from sqlalchemy.orm import DeclarativeBase, relationship
 from app.models.base import Base
 from app.models.user import User
@@ -12,7 +12,9 @@ class Product(Base):
     price = Column(Integer)
     image_url = Column(String)
     stock = Column(Integer)
-    rating = Column(Integer)
+    rating = Column(Float, default=0.0)
+    review_count = Column(Integer, nullable=False, default=0, server_default='0')
+    grade_sum = Column(Integer, nullable=False, default=0, server_default='0')
     is_active = Column(Boolean, default=True)
 
     reviews = relationship("Review", back_populates="product")
@@ -20,6 +22,14 @@ class Product(Base):
     category_id = Column(Integer, ForeignKey('categories.id'))
     category = relationship('Category', back_populates='products')
 
+    # Частичный индекс по активным товарам категории (поиск и экспорт по категориям);
+    # индексы под сортировки листингов живут на product_listing
+    __table_args__ = (
+        Index('ix_products_category_listing', category_id, name, id,
+              postgresql_where=text('is_active'), sqlite_where=text('is_active = 1')),
+        {'extend_existing': True},
+    )
+
 
 
 
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Index, text
 from sqlalchemy.orm import relationship
 
 from app.models.base import Base
@@ -18,4 +18,22 @@ class Review(Base):
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     product = relationship("Product", back_populates="reviews")
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    user = relationship("User", back_populates="reviews")
\ No newline at end of file
+    user = relationship("User", back_populates="reviews")
+
+    # Частичные индексы под ленты отзывов: общая и по товару, сортировка (creation_date, id)
+    __table_args__ = (
+        Index('ix_reviews_product_feed', product_id, creation_date, id,
+              postgresql_where=text('is_active'), sqlite_where=text('is_active = 1')),
+        Index('ix_reviews_feed', creation_date, id,
+              postgresql_where=text('is_active'), sqlite_where=text('is_active = 1')),
+        {'extend_existing': True},
+    )
+
+
+class ReviewGradeCount(Base):
+    '''Число активных отзывов товара с данной оценкой: гистограмма без прохода по reviews'''
+    __tablename__ = 'review_grade_counts'
+
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    grade = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0, server_default='0')
@@ -6,11 +6,12 @@ import jwt
 from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, status, HTTPException
 from fastapi.security import HTTPBasic, OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
-from sqlalchemy import select, insert
+from sqlalchemy import select, insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.backend.db_depends import get_db
+from app.backend.hashing import password_hasher
+from app.backend.tokens import token_store, token_digest
 from app.models.user import User
 from app.schemas import CreateUser
 
@@ -21,18 +22,20 @@ ALGORITHM = os.getenv("ALGORITHM")
 security = HTTPBasic()
 
 router = APIRouter(prefix='/auth', tags=['auth'])
-bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 
 async def create_access_token(username: str, user_id: int, is_admin: bool, is_supplier: bool, is_customer: bool,
                               expires_delta: timedelta):
+    now = datetime.now(timezone.utc)
     payload = {
         'sub': username,
         'id': user_id,
         'is_admin': is_admin,
         'is_supplier': is_supplier,
         'is_customer': is_customer,
-        'exp': datetime.now(timezone.utc) + expires_delta
+        # Дробные секунды, чтобы токен, выданный сразу после отзыва, не попал под него
+        'iat': now.timestamp(),
+        'exp': now + expires_delta
     }
     payload['exp'] = int(payload['exp'].timestamp())
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
@@ -40,12 +43,19 @@ async def create_access_token(username: str, user_id: int, is_admin: bool, is_su
 
 async def authenticate_user(db: Annotated[AsyncSession, Depends(get_db)], username: str, password: str):
     user = await db.scalar(select(User).where(User.username == username))
-    if not user or not bcrypt_context.verify(password, user.hashed_password) or user.is_active == False:
+    verified, new_hash = False, None
+    if user:
+        verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not verified or user.is_active == False:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Хеш создан со старым cost factor - перехешируем прозрачно для пользователя
+        await db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
     return user
 
 @router.get('/users/me')
@@ -55,11 +65,12 @@ async def read_current_user(user: dict = Depends(authenticate_user)):
 
 @router.post('/', status_code=status.HTTP_201_CREATED)
 async def create_user(session: Annotated[AsyncSession, Depends(get_db)], create_user: CreateUser):
+    hashed_password = await password_hasher.hash(create_user.password)
     await session.execute(insert(User).values(first_name=create_user.first_name,
                                          last_name=create_user.last_name,
                                          username=create_user.username,
                                          email=create_user.email,
-                                         hashed_password=bcrypt_context.hash(create_user.password),
+                                         hashed_password=hashed_password,
                                          ))
     await session.commit()
     return {
@@ -69,7 +80,7 @@ async def create_user(session: Annotated[AsyncSession, Depends(get_db)], create_
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str | None = payload.get('sub')
@@ -111,18 +122,48 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
             'is_admin': is_admin,
             'is_supplier': is_supplier,
             'is_customer': is_customer,
+            'iat': payload.get('iat', 0),
+            'exp': expire,
         }
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token expired!"
         )
-    except jwt.exceptions:
+    except jwt.InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Could not validate user'
         )
 
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    # Подпись проверяется один раз на токен, дальше claims берутся из кэша до истечения exp
+    digest = token_digest(token)
+    claims = await token_store.get_claims(digest)
+    if claims is None:
+        claims = decode_token(token)
+        await token_store.set_claims(digest, claims)
+    elif claims['exp'] < datetime.now(timezone.utc).timestamp():
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token expired!"
+        )
+
+    # Смена роли или удаление пользователя отзывают все его токены, выданные раньше
+    issued_before = await token_store.min_issued_at(claims['id'])
+    if issued_before is not None and claims['iat'] < issued_before:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Token has been revoked'
+        )
+    return {
+        'username': claims['username'],
+        'id': claims['id'],
+        'is_admin': claims['is_admin'],
+        'is_supplier': claims['is_supplier'],
+        'is_customer': claims['is_customer'],
+    }
+
 async def get_admin_user(user: Annotated[dict, Depends(get_current_user)]):
     if not user.get('is_admin'):
         raise HTTPException(
@@ -0,0 +1,82 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select, update, delete, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.backend.db_depends import get_db
+from app.backend.responses import FastJSONResponse
+from app.models import CartItem, Product, User
+from app.routers.auth import get_customer_user
+from app.schemas import CartItemIn, CartItemOut
+
+router = APIRouter(prefix='/cart', tags=['cart'])
+
+
+@router.get('/', response_model=list[CartItemOut])
+async def get_cart(
+        session: Annotated[AsyncSession, Depends(get_db)],
+        user: Annotated[User, Depends(get_customer_user)],
+):
+    # Корзину читаем с основной базы: клиент только что её менял
+    query = select(
+        CartItem.product_id, Product.name, Product.slug, Product.price, Product.stock, CartItem.quantity
+    ).join(Product, CartItem.product_id == Product.id).where(
+        CartItem.user_id == user.get('id')
+    ).order_by(CartItem.id)
+    items = (await session.execute(query)).mappings().all()
+    return FastJSONResponse([dict(item) for item in items])
+
+
+@router.post('/', status_code=status.HTTP_201_CREATED)
+async def add_to_cart(
+        session: Annotated[AsyncSession, Depends(get_db)],
+        item: CartItemIn,
+        user: Annotated[User, Depends(get_customer_user)],
+):
+    # Один INSERT ... SELECT ... ON CONFLICT: параллельные добавления того же товара складываются,
+    # а не падают на уникальном ключе (user_id, product_id)
+    dialect_insert = postgresql.insert if session.bind.dialect.name == 'postgresql' else sqlite.insert
+    query = dialect_insert(CartItem).from_select(
+        ['user_id', 'product_id', 'quantity'],
+        select(literal(user.get('id')), Product.id, literal(item.quantity)).where(Product.id == item.product_id,
+                                                                                  Product.is_active == True),
+    )
+    query = query.on_conflict_do_update(
+        index_elements=[CartItem.user_id, CartItem.product_id],
+        set_={'quantity': CartItem.quantity + query.excluded.quantity},
+    )
+    if await session.scalar(query.returning(CartItem.id)) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    await session.commit()
+    return {'status_code': status.HTTP_201_CREATED, 'transaction': 'Successful'}
+
+
+@router.put('/')
+async def set_quantity(
+        session: Annotated[AsyncSession, Depends(get_db)],
+        item: CartItemIn,
+        user: Annotated[User, Depends(get_customer_user)],
+):
+    query = update(CartItem).where(
+        CartItem.user_id == user.get('id'),
+        CartItem.product_id == item.product_id
+    ).values(quantity=item.quantity)
+    if await session.scalar(query.returning(CartItem.id)) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product is not in the cart")
+    await session.commit()
+    return {'status_code': status.HTTP_200_OK, 'transaction': 'Cart update is successful'}
+
+
+@router.delete('/{product_id}')
+async def remove_from_cart(
+        session: Annotated[AsyncSession, Depends(get_db)],
+        product_id: int,
+        user: Annotated[User, Depends(get_customer_user)],
+):
+    query = delete(CartItem).where(CartItem.user_id == user.get('id'), CartItem.product_id == product_id)
+    if await session.scalar(query.returning(CartItem.id)) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product is not in the cart")
+    await session.commit()
+    return {'status_code': status.HTTP_200_OK, 'transaction': 'Cart item delete is successful'}
@@ -1,15 +1,20 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, Request, status, HTTPException
 from slugify import slugify
 from sqlalchemy import insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.backend.db_depends import get_db
-from app.models import User
+from app.backend.cache import response_cache, cached_response
+from app.backend.category_tree import category_tree
+from app.backend.db_depends import get_db, read_session
+from app.backend.listing import refresh_listing
+from app.backend.responses import dumps
+from app.models import Product, ProductListing, User
 from app.models.category import Category
 from app.routers.auth import get_admin_user
-from app.schemas import CreateCategory
+from app.routers.products import RESERVED_CATEGORY_SLUGS
+from app.schemas import CreateCategory, CategoryOut
 
 router = APIRouter(
     prefix='/categories',
@@ -17,13 +22,23 @@ router = APIRouter(
 )
 
 
-@router.get('/')
-async def get_all_categories(
-        db: Annotated[AsyncSession, Depends(get_db)],
-):
-    query = select(Category).order_by(Category.name).where(Category.is_active == True)
-    categories = await db.scalars(query)
-    return categories.all()
+def category_slug_for(name: str) -> str:
+    slug = slugify(name)
+    if slug in RESERVED_CATEGORY_SLUGS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f'Category name "{name}" is reserved, choose another one')
+    return slug
+
+
+@router.get('/', response_model=list[CategoryOut])
+async def get_all_categories(request: Request):
+    # Сессия нужна только для загрузки дерева, и то лишь при промахе кэша
+    async def load() -> bytes:
+        async with read_session(request) as session:
+            tree = await category_tree.ensure_loaded(session)
+        return dumps([node.as_dict() for node in tree.active()])
+
+    return await cached_response(request, 'categories', ['categories'], load)
 
 
 @router.post('/', status_code=status.HTTP_201_CREATED)
@@ -37,9 +52,10 @@ async def create_category(
         if parent is None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Parent category does not exist')
 
-    await session.execute(insert(Category).values(name=new_category.name,
+    slug = category_slug_for(new_category.name)
+    category_id = await session.scalar(insert(Category).values(name=new_category.name,
                                        parent_id=new_category.parent_id,
-                                       slug=slugify(new_category.name)))
+                                       slug=slug).returning(Category.id))
     # category_model = Category(
     #     name=new_category.name,
     #     parent_id=new_category.parent_id,
@@ -48,6 +64,8 @@ async def create_category(
     # db.add(category_model)
 
     await session.commit()
+    category_tree.upsert(category_id, new_category.name, slug, new_category.parent_id)
+    await response_cache.invalidate('categories')
     return {
         'status_code': status.HTTP_201_CREATED,
         'transaction': 'Successful'
@@ -65,10 +83,13 @@ async def update_category(
     category = await session.scalar(query)
     if category is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    slug = category_slug_for(update_category.name)
     await session.execute(update(Category).where(Category.slug == category_slug).values(name=update_category.name,
-                                                                                  slug=slugify(update_category.name),
+                                                                                  slug=slug,
                                                                                   parent_id=category.parent_id,))
     await session.commit()
+    category_tree.upsert(category.id, update_category.name, slug, category.parent_id, category.is_active)
+    await response_cache.invalidate('listings', 'categories')
     return {
         'status_code': status.HTTP_200_OK,
         'transaction': 'Category update is successful'
@@ -86,7 +107,12 @@ async def delete_category(
         category.is_active = False
     else:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Category not found')
+    # Товары всего поддерева пропадают из листингов вместе с категорией
+    subtree = select(ProductListing.id).where(ProductListing.category_path.contains(f'/{category.id}/'))
+    await session.execute(refresh_listing(session.bind.dialect.name, Product.id.in_(subtree)))
     await session.commit()
+    category_tree.deactivate(category.id)
+    await response_cache.invalidate('listings', 'categories')
     return {
         'status_code': status.HTTP_200_OK,
         'transaction': 'Category delete is successful'
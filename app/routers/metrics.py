@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends
+
+from app.backend.cache import response_cache
+from app.backend.compression import compression_stats
+from app.backend.db import pool_status, engine, replica_engine, replica_health
+from app.backend.invalidation import invalidation_bus
+from app.backend.singleflight import single_flight
+from app.backend.tokens import token_store
+from app.backend.write_behind import write_behind
+from app.routers.auth import get_admin_user
+
+# Счётчики раскрывают устройство сервиса, поэтому доступны только администратору
+router = APIRouter(prefix='/metrics', tags=['metrics'], dependencies=[Depends(get_admin_user)])
+
+
+@router.get('/db-pool')
+async def db_pool_metrics():
+    return {
+        'primary': pool_status(engine),
+        'replica': pool_status(replica_engine) | {
+            'available': replica_health.available(),
+            'failures': replica_health.failures,
+        } if replica_engine is not None else None,
+    }
+
+
+@router.get('/cache')
+async def cache_metrics():
+    return response_cache.stats()
+
+
+@router.get('/single-flight')
+async def single_flight_metrics():
+    return single_flight.stats()
+
+
+@router.get('/auth-tokens')
+async def auth_token_metrics():
+    return token_store.stats()
+
+
+@router.get('/write-behind')
+async def write_behind_metrics():
+    return write_behind.stats()
+
+
+@router.get('/invalidation')
+async def invalidation_metrics():
+    return invalidation_bus.stats()
+
+
+@router.get('/compression')
+async def compression_metrics():
+    return compression_stats.as_dict()
@@ -0,0 +1,118 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select, insert, update, delete, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.backend.cache import invalidate_products
+from app.backend.db_depends import get_db
+from app.backend.facets import facet_index
+from app.backend.listing import refresh_listing
+from app.backend.responses import FastJSONResponse
+from app.models import CartItem, Order, OrderItem, Product, User
+from app.routers.auth import get_current_user, get_customer_user
+from app.schemas import OrderOut
+
+router = APIRouter(prefix='/orders', tags=['orders'])
+
+ORDER_COLUMNS = [Order.id, Order.status, Order.total, Order.creation_date, Order.user_id]
+ORDER_ITEM_COLUMNS = [OrderItem.product_id, OrderItem.quantity, OrderItem.price]
+
+
+def reserve_stock(dialect: str, user_id: int, product_ids: list[int]):
+    '''Одним UPDATE ... FROM cart_items списывает остатки по всем позициям корзины.
+
+    Строка товара меняется, только если stock >= quantity; условие проверяется под блокировкой
+    строки, поэтому параллельные покупатели одного товара не уводят его в минус. RETURNING отдаёт
+    списанное количество - из него и собирается заказ.
+    '''
+    # Блокируем строки товаров в порядке id, чтобы корзины с общими товарами не ловили deadlock.
+    # На SQLite FOR UPDATE не нужен и не выводится: запись и так сериализуется
+    locked_ids = select(Product.id).where(Product.id.in_(product_ids)).order_by(Product.id).with_for_update()
+    # SQLite не пускает в RETURNING колонки таблиц из FROM: там количество берётся подзапросом в том же снимке.
+    # Внутри RETURNING SQLAlchemy пишет колонки без имени таблицы, и products.id превратился бы в id строки корзины
+    line = aliased(CartItem)
+    quantity = CartItem.quantity if dialect == 'postgresql' else select(line.quantity).where(
+        line.user_id == user_id, line.product_id == literal_column('products.id')).scalar_subquery()
+    return update(Product).where(
+        Product.id == CartItem.product_id,
+        CartItem.user_id == user_id,
+        Product.is_active == True,
+        Product.stock >= CartItem.quantity,
+        Product.id.in_(locked_ids),
+    ).values(stock=Product.stock - CartItem.quantity).returning(
+        Product.id, Product.slug, Product.price, Product.stock, Product.category_id, quantity.label('quantity')
+    )
+
+
+@router.post('/checkout', status_code=status.HTTP_201_CREATED)
+async def checkout(
+        session: Annotated[AsyncSession, Depends(get_db)],
+        user: Annotated[User, Depends(get_customer_user)],
+):
+    user_id = user.get('id')
+    product_ids = (await session.scalars(
+        select(CartItem.product_id).where(CartItem.user_id == user_id).order_by(CartItem.product_id)
+    )).all()
+    if not product_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cart is empty")
+
+    dialect = session.bind.dialect.name
+    reserved = (await session.execute(reserve_stock(dialect, user_id, product_ids))).all()
+    if len(reserved) != len(product_ids):
+        # Хотя бы одна позиция не списалась: либо не хватило остатка, либо её уже убрали из корзины
+        missing = sorted(set(product_ids) - {row.id for row in reserved})
+        in_cart = set((await session.scalars(select(CartItem.product_id).where(
+            CartItem.user_id == user_id, CartItem.product_id.in_(missing)))).all())
+        # Откатываем списание по остальным позициям
+        await session.rollback()
+        if len(in_cart) != len(missing):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="Cart changed during checkout, review it and try again")
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"Not enough stock for products: {missing}")
+
+    # Количества и цены - те, по которым списан остаток, а не прочитанные до UPDATE
+    total = sum(row.price * row.quantity for row in reserved)
+    order_id = await session.scalar(insert(Order).values(user_id=user_id, total=total).returning(Order.id))
+    await session.execute(insert(OrderItem), [
+        {'order_id': order_id, 'product_id': row.id, 'quantity': row.quantity, 'price': row.price}
+        for row in sorted(reserved, key=lambda row: row.id)
+    ])
+    reserved_ids = [row.id for row in reserved]
+    await session.execute(delete(CartItem).where(CartItem.user_id == user_id, CartItem.product_id.in_(reserved_ids)))
+    await session.execute(refresh_listing(dialect, Product.id.in_(reserved_ids)))
+    await session.commit()
+    for row in reserved:
+        if row.stock == 0:
+            # Последние штуки распроданы - товар уходит из фасетов "в наличии"
+            facet_index.move((row.category_id, row.price, row.quantity), (row.category_id, row.price, 0))
+    # Остатки видны в карточках и листингах (stock > 0)
+    await invalidate_products([row.slug for row in reserved], {row.category_id for row in reserved})
+    return {'status_code': status.HTTP_201_CREATED, 'transaction': 'Successful', 'order_id': order_id}
+
+
+@router.get('/', response_model=list[OrderOut])
+async def my_orders(
+        session: Annotated[AsyncSession, Depends(get_db)],
+        user: Annotated[dict, Depends(get_current_user)],
+):
+    query = select(*ORDER_COLUMNS).where(Order.user_id == user.get('id')).order_by(Order.id.desc())
+    orders = (await session.execute(query)).mappings().all()
+    return FastJSONResponse([dict(order) for order in orders])
+
+
+@router.get('/{order_id}', response_model=OrderOut)
+async def order_detail(
+        session: Annotated[AsyncSession, Depends(get_db)],
+        order_id: int,
+        user: Annotated[dict, Depends(get_current_user)],
+):
+    order = (await session.execute(select(*ORDER_COLUMNS).where(Order.id == order_id))).mappings().one_or_none()
+    if order is None or (order['user_id'] != user.get('id') and not user.get('is_admin')):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    items = (await session.execute(
+        select(*ORDER_ITEM_COLUMNS).where(OrderItem.order_id == order_id).order_by(OrderItem.id)
+    )).mappings().all()
+    return FastJSONResponse({**order, 'items': [dict(item) for item in items]})
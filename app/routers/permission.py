@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from app.backend.db_depends import get_db
+from app.backend.tokens import revoke_user_tokens
 from app.models.user import User
 from .auth import get_current_user
 
@@ -26,6 +27,7 @@ async def supplier_permission(db: Annotated[AsyncSession, Depends(get_db)], get_
         if user.is_supplier:
             await db.execute(update(User).where(User.id == user_id).values(is_supplier=False, is_customer=True))
             await db.commit()
+            await revoke_user_tokens(user_id)
             return {
                 'status_code': status.HTTP_200_OK,
                 'detail': 'User is no longer supplier'
@@ -33,6 +35,7 @@ async def supplier_permission(db: Annotated[AsyncSession, Depends(get_db)], get_
         else:
             await db.execute(update(User).where(User.id == user_id).values(is_supplier=True, is_customer=False))
             await db.commit()
+            await revoke_user_tokens(user_id)
             return {
                 'status_code': status.HTTP_200_OK,
                 'detail': 'User is now supplier'
@@ -63,6 +66,7 @@ async def delete_user(db: Annotated[AsyncSession, Depends(get_db)], get_user: An
         if user.is_active:
             await db.execute(update(User).where(User.id == user_id).values(is_active=False))
             await db.commit()
+            await revoke_user_tokens(user_id)
             return {
                 'status_code': status.HTTP_200_OK,
                 'detail': 'User is deleted'
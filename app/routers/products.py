@@ -1,31 +1,264 @@
+import time
+from dataclasses import dataclass
 from typing import Annotated
 
-from fastapi import APIRouter, status, Depends, HTTPException
+from fastapi import APIRouter, status, Depends, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from slugify import slugify
-from sqlalchemy import select, update, insert
+from sqlalchemy import select, update, insert, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.backend.db_depends import get_db
-from app.models import Product, Category, User
+from app.backend.bulk_import import IMPORT_MAX_ERRORS, IMPORT_FORMATS, detect_format, iter_rows, chunked
+from app.backend.cache import response_cache, invalidate_products, cached_response
+from app.backend.category_tree import CategoryTree, category_tree
+from app.backend.db_depends import get_db, read_session
+from app.backend.export import EXPORT_BATCH_SIZE, EXPORT_MEDIA_TYPES, encode_batches
+from app.backend.facets import facet_index
+from app.backend.listing import refresh_listing
+from app.backend.pagination import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, BATCH_MAX_SIZE, encode_cursor, decode_cursor,
+                                    parse_fields)
+from app.backend.responses import FastJSONResponse, dumps
+from app.backend.search import search_terms, search_query
+from app.models import Product, ProductListing, Category, User
 from app.routers.auth import get_supplier_or_admin_user
-from app.schemas import CreateProduct
+from app.schemas import CreateProduct, ProductOut, ProductPage, ProductBatch, ImportReport, SearchPage, Facets
 
 router = APIRouter(prefix='/products', tags=['products'])
 
-@router.get('/')
+# Статические GET-ручки /products/<слово> объявлены раньше /products/{category_slug} и перекрывают
+# категорию с таким же slug, поэтому эти slug категориям не выдаются
+RESERVED_CATEGORY_SLUGS = frozenset({'batch', 'facets', 'search', 'export'})
+
+PRODUCT_FIELDS = {name: Product.__table__.c[name] for name in ProductOut.model_fields}
+# Листинги читают только read model product_listing, без products и categories
+LISTING_FIELDS = {name: ProductListing.__table__.c[name] for name in ProductOut.model_fields}
+
+# Сортировки листингов: колонка и направление; вторым ключом всегда идёт id в том же направлении
+SORTS = {
+    'name': (ProductListing.name, False),
+    'price': (ProductListing.price, False),
+    '-price': (ProductListing.price, True),
+    'rating': (ProductListing.rating, True),
+    'newest': (ProductListing.id, True),
+}
+
+
+@dataclass
+class ListingFilters:
+    '''Фильтры и сортировка листингов из query-параметров'''
+    sort: str = Query('name', pattern=f"^({'|'.join(SORTS)})$")
+    price_min: int | None = Query(None, ge=0)
+    price_max: int | None = Query(None, ge=0)
+    min_rating: float | None = Query(None, ge=0, le=5)
+    in_stock: bool = True
+
+    def apply(self, query):
+        if self.price_min is not None:
+            query = query.where(ProductListing.price >= self.price_min)
+        if self.price_max is not None:
+            query = query.where(ProductListing.price <= self.price_max)
+        if self.min_rating is not None:
+            query = query.where(ProductListing.rating >= self.min_rating)
+        if self.in_stock:
+            query = query.where(ProductListing.stock > 0)
+        return query
+
+    def key(self) -> str:
+        return f'{self.sort}:{self.price_min}:{self.price_max}:{self.min_rating}:{self.in_stock}'
+
+
+def listing_query(fields: str | None, sort: str = 'name'):
+    '''Выбирает только запрошенные колонки видимых товаров плюс ключ сортировки и id для курсора'''
+    columns = parse_fields(fields, LISTING_FIELDS)
+    query = select(*columns, SORTS[sort][0].label('cursor_key'), ProductListing.id.label('cursor_id'))
+    return query.where(ProductListing.listed == True), [column.name for column in columns]
+
+
+async def fetch_page(session: AsyncSession, query, keys: list[str], cursor: str | None, limit: int,
+                     sort: str = 'name'):
+    column, descending = SORTS[sort]
+    if cursor:
+        cursor_sort, value, product_id = decode_cursor(cursor, 3)
+        if cursor_sort != sort:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Cursor belongs to another sort')
+        position = tuple_(column, ProductListing.id)
+        query = query.where(position < (value, product_id) if descending else position > (value, product_id))
+    order = (column.desc(), ProductListing.id.desc()) if descending else (column, ProductListing.id)
+    query = query.order_by(*order).limit(limit + 1)
+    rows = (await session.execute(query)).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, rows[-1]['cursor_key'], rows[-1]['cursor_id'])
+    return {
+        'items': [{key: row[key] for key in keys} for row in rows],
+        'next_cursor': next_cursor
+    }
+
+
+@router.get('/', response_model=ProductPage)
 async def all_products(
-        session: AsyncSession = Depends(get_db),
+        request: Request,
+        filters: Annotated[ListingFilters, Depends()],
+        cursor: str | None = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        fields: str | None = None,
 ):
-    query = select(Product).join(Category).where(
-        Product.is_active == True,
-        Category.is_active == True,
-        Product.stock > 0,
-    ).order_by(Product.name)
-    products = await session.scalars(query)
-    products = products.all()
-    if not products:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="There are no products")
-    return products
+    query, keys = listing_query(fields, filters.sort)
+    query = filters.apply(query)
+
+    # Сессия открывается только при промахе кэша
+    async def load() -> bytes:
+        async with read_session(request) as session:
+            page = await fetch_page(session, query, keys, cursor, limit, filters.sort)
+        if not page['items'] and cursor is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="There are no products")
+        return dumps(page)
+
+    key = f'listing:all:{cursor}:{limit}:{fields}:{filters.key()}'
+    return await cached_response(request, key, ['listings', 'listing:all'], load)
+
+
+@router.get('/batch', response_model=ProductBatch)
+async def products_batch(
+        request: Request,
+        slug: list[str] = Query([], max_length=BATCH_MAX_SIZE),
+        id: list[int] = Query([], max_length=BATCH_MAX_SIZE),
+):
+    '''Карточки товаров по списку slug или id одним запросом IN (...), в порядке запроса.
+
+    Карточки по slug сначала берутся из кэша detail, в базу идут только промахи;
+    загруженные карточки кладутся в тот же кэш. Карточки по id в кэш не кладутся: их ключи (slug)
+    известны только после чтения, и снять номера сброса до него нельзя.
+    '''
+    if bool(slug) == bool(id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass either slug or id values")
+    keys = list(dict.fromkeys(slug or id))
+    bodies: dict[str | int, bytes] = {}
+    if slug:
+        cached = await response_cache.get_many([f'product:{key}' for key in keys], request)
+        bodies = {key: cached[f'product:{key}'] for key in keys if f'product:{key}' in cached}
+    wanted = [key for key in keys if key not in bodies]
+    if wanted:
+        column = Product.slug if slug else Product.id
+        query = select(*PRODUCT_FIELDS.values()).where(column.in_(wanted), Product.is_active == True)
+        started = time.time()
+        # Снимок до SELECT: карточку, которую сбросила параллельная запись, store_many не положит
+        generations = await response_cache.generations([f'product:{key}' for key in wanted]) if slug else None
+        async with read_session(request) as session:
+            products = (await session.execute(query)).mappings().all()
+        loaded = {product['slug']: dumps(dict(product)) for product in products}
+        if generations is not None:
+            await response_cache.store_many({f'product:{key}': body for key, body in loaded.items()}, generations,
+                                            request, started)
+        bodies.update((product[column.name], loaded[product['slug']]) for product in products)
+    missing = [key for key in keys if key not in bodies]
+    # Карточки уже сериализованы - склеиваем байты, а не собираем и кодируем список заново
+    return FastJSONResponse(
+        b'{"items":[' + b','.join(bodies[key] for key in keys if key in bodies) + b'],"missing":' + dumps(missing) + b'}'
+    )
+
+
+@router.get('/facets', response_model=Facets)
+async def product_facets(request: Request, category: str | None = None, in_stock: bool = True):
+    '''Число товаров по дочерним категориям и ценовым корзинам; считается по счётчикам в памяти'''
+    async with read_session(request) as session:
+        tree = await category_tree.ensure_loaded(session)
+        facets = await facet_index.ensure_loaded(session)
+    root = None
+    if category is not None:
+        root = tree.get_by_slug(category)
+        if root is None or not root.is_active:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+    return FastJSONResponse(facets.facets(tree, root, in_stock))
+
+
+@router.get('/search', response_model=SearchPage)
+async def search_products(
+        request: Request,
+        q: str = Query(..., min_length=1, max_length=200),
+        category: str | None = None,
+        price_min: int | None = Query(None, ge=0),
+        price_max: int | None = Query(None, ge=0),
+        min_rating: float | None = Query(None, ge=0, le=5),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        offset: int = Query(0, ge=0, le=10 * MAX_PAGE_SIZE),
+        fields: str | None = None,
+):
+    '''Полнотекстовый поиск по имени и описанию; последнее слово ищется как префикс'''
+    terms = search_terms(q)
+    columns = parse_fields(fields, PRODUCT_FIELDS)
+    keys = [column.name for column in columns]
+
+    async def load() -> bytes:
+        if not terms:
+            return dumps({'items': [], 'next_offset': None})
+        async with read_session(request) as session:
+            query, rank = search_query(session.bind.dialect.name, terms, columns)
+            query = query.where(Product.is_active == True)
+            if category is not None:
+                tree = await category_tree.ensure_loaded(session)
+                categories_ids = tree.descendant_ids(category)
+                if not categories_ids:
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+                query = query.where(Product.category_id.in_(categories_ids))
+            if price_min is not None:
+                query = query.where(Product.price >= price_min)
+            if price_max is not None:
+                query = query.where(Product.price <= price_max)
+            if min_rating is not None:
+                query = query.where(Product.rating >= min_rating)
+            query = query.order_by(rank, Product.id).offset(offset).limit(limit + 1)
+            rows = (await session.execute(query)).all()
+        return dumps({
+            'items': [dict(zip(keys, row)) for row in rows[:limit]],
+            'next_offset': offset + limit if len(rows) > limit else None,
+        })
+
+    # Любая запись товара сбрасывает listing:all, а с ним и результаты поиска
+    key = f'search:{terms}:{category}:{price_min}:{price_max}:{min_rating}:{limit}:{offset}:{fields}'
+    return FastJSONResponse(await response_cache.get_or_load(key, ['listings', 'listing:all'], load, request))
+
+
+@router.get('/export')
+async def export_products(
+        request: Request,
+        format: str = Query('ndjson', pattern=f"^({'|'.join(EXPORT_MEDIA_TYPES)})$"),
+        category: str | None = None,
+        fields: str | None = None,
+):
+    '''Весь каталог активных товаров (или поддерево категории) потоком NDJSON или CSV.
+
+    Строки читаются серверным курсором пачками по EXPORT_BATCH_SIZE и сразу уходят клиенту,
+    поэтому память воркера не зависит от размера каталога.
+    '''
+    columns = parse_fields(fields, PRODUCT_FIELDS)
+    query = select(*columns).where(Product.is_active == True)
+    if category is not None:
+        async with read_session(request) as session:
+            tree = await category_tree.ensure_loaded(session)
+        categories_ids = tree.descendant_ids(category)
+        if not categories_ids:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+        query = query.where(Product.category_id.in_(categories_ids))
+    query = query.order_by(Product.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    async def partitions():
+        # Сессия живёт внутри генератора: ответ отправляется уже после выхода из обработчика
+        async with read_session(request) as session:
+            result = await session.stream(query)
+            async for rows in result.partitions():
+                yield rows
+
+    keys = [column.name for column in columns]
+    return StreamingResponse(
+        encode_batches(partitions(), format, keys),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={'Content-Disposition': f'attachment; filename="products.{format}"'},
+    )
+
 
 @router.post('/')
 async def create_product(
@@ -51,7 +284,6 @@ async def create_product(
             price=product.price,
             image_url=product.image_url,
             stock=product.stock,
-            rating=0.0,
             is_active=True
         )
     else:
@@ -67,38 +299,161 @@ async def create_product(
         is_active=True,
         user_id=user.get('id')
         )
+    # Реактивированный товар мог лежать в другой категории, её листинги тоже устарели
+    category_ids = [product.category, obj_in_db.category_id] if obj_in_db else [product.category]
     await session.execute(query)
+    await session.execute(refresh_listing(session.bind.dialect.name, Product.slug == slug))
     await session.commit()
+    facet_index.move(None, (product.category, product.price, product.stock))
+    await invalidate_products([slug], category_ids)
     return {'status_code': status.HTTP_201_CREATED,
 'transaction': 'Successful'}
 
 
-@router.get('/{category_slug}')
+def validate_chunk(chunk: list, tree: CategoryTree, user: dict) -> tuple[dict[str, dict], dict[str, int], list[dict]]:
+    '''Проверяет строки через CreateProduct; повтор slug внутри чанка перекрывает предыдущую строку.
+
+    Возвращает значения для upsert и номер строки файла по slug, а также ошибки.
+    '''
+    rows: dict[str, dict] = {}
+    lines: dict[str, int] = {}
+    errors = []
+    for line, data, error in chunk:
+        if error is None:
+            try:
+                product = CreateProduct.model_validate(data)
+            except ValidationError as exc:
+                error = '; '.join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in exc.errors())
+        if error is None:
+            category = tree.get(product.category)
+            slug = slugify(product.name)
+            if category is None or not category.is_active:
+                error = 'Category not found'
+            elif not slug:
+                error = 'Product name gives an empty slug'
+        if error is not None:
+            errors.append({'row': line, 'detail': error})
+            continue
+        if slug in lines:
+            errors.append({'row': lines[slug], 'detail': f'Superseded by row {line}'})
+        lines[slug] = line
+        rows[slug] = {
+            'category_id': product.category,
+            'name': product.name,
+            'slug': slug,
+            'description': product.description,
+            'price': product.price,
+            'image_url': product.image_url,
+            'stock': product.stock,
+            'rating': 0.0,
+            'review_count': 0,
+            'grade_sum': 0,
+            'is_active': True,
+            'user_id': user.get('id'),
+        }
+    return rows, lines, errors
+
+
+def upsert_products(dialect: str, user: dict):
+    '''INSERT ... ON CONFLICT (slug) DO UPDATE, возвращает slug записанных строк.
+
+    Выполняется с параметрами всего чанка: SQLAlchemy (insertmanyvalues) склеивает их в multi-row
+    VALUES, а сам запрос компилируется один раз и берётся из кэша.
+    '''
+    dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    query = dialect_insert(Product)
+    query = query.on_conflict_do_update(
+        index_elements=[Product.slug],
+        set_={name: query.excluded[name] for name in
+              ('category_id', 'name', 'description', 'price', 'image_url', 'stock', 'is_active')},
+        # Поставщик обновляет только свои товары, как и в update_product
+        where=None if user.get('is_admin') else Product.user_id == user.get('id'),
+    )
+    return query.returning(Product.slug)
+
+
+@router.post('/import', response_model=ImportReport)
+async def import_products(
+        session: Annotated[AsyncSession, Depends(get_db)],
+        user: Annotated[User, Depends(get_supplier_or_admin_user)],
+        file: UploadFile,
+        format: str | None = Query(None, pattern=f"^({'|'.join(IMPORT_FORMATS)})$"),
+):
+    fmt = detect_format(file.filename, file.content_type, format)
+    tree = await category_tree.ensure_loaded(session)
+    dialect = session.bind.dialect.name
+    report = {'processed': 0, 'imported': 0, 'failed': 0, 'errors': []}
+
+    def fail(errors: list[dict]):
+        report['failed'] += len(errors)
+        report['errors'].extend(errors[:IMPORT_MAX_ERRORS - len(report['errors'])])
+
+    # Каждый чанк - отдельная транзакция: память и блокировки ограничены размером чанка, а не файла
+    for chunk in chunked(iter_rows(file.file, fmt)):
+        report['processed'] += len(chunk)
+        rows, lines, errors = validate_chunk(chunk, tree, user)
+        fail(errors)
+        if not rows:
+            continue
+        connection = await session.connection()
+        result = await connection.execute(upsert_products(dialect, user), list(rows.values()))
+        written = set(result.scalars())
+        if written:
+            await connection.execute(refresh_listing(dialect, Product.slug.in_(written)))
+        await session.commit()
+        report['imported'] += len(written)
+        fail([{'row': lines[slug], 'detail': 'You are not authorized to update this product'}
+              for slug in rows if slug not in written])
+        await response_cache.invalidate(*(f'product:{slug}' for slug in written))
+
+    if report['imported']:
+        # Импорт обычно задевает много категорий сразу - проще сбросить все листинги и пересчитать фасеты
+        facet_index.invalidate()
+        await response_cache.invalidate('listings')
+    report['errors'].sort(key=lambda error: error['row'])
+    return report
+
+
+@router.get('/{category_slug}', response_model=ProductPage)
 async def product_by_category(
         category_slug: str,
-        session: Annotated[AsyncSession, Depends(get_db)],
+        request: Request,
+        filters: Annotated[ListingFilters, Depends()],
+        cursor: str | None = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        fields: str | None = None,
 ):
-    category = await session.scalar(select(Category).where(Category.slug == category_slug))
-    if not category:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
-    query = select(Category.id).where(Category.parent_id == category.id)
-    categories_corutine = await session.scalars(query)
-    categories_ids = [category.id] + categories_corutine.all()
-    query = select(Product).where(
-        Product.category_id.in_(categories_ids),
-                                  Product.is_active == True,
-                                  Product.stock > 0
-    ).order_by(Product.name)
-    products = await session.scalars(query)
-    return products.all()
-
-@router.get('/detail/{product_slug}')
-async def product_detail(product_slug: str, session: Annotated[AsyncSession, Depends(get_db)]):
-    query = select(Product).where(Product.slug == product_slug, Product.is_active == True)
-    product = await session.scalar(query)
-    if not product:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="There is no product found")
-    return product
+    query, keys = listing_query(fields, filters.sort)
+
+    async def load() -> bytes:
+        async with read_session(request) as session:
+            tree = await category_tree.ensure_loaded(session)
+            category = tree.get_by_slug(category_slug)
+            if category is None or not category.is_active:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+            # Поддерево - диапазон путей с префиксом /.../id/: '0' идёт в ASCII сразу после '/'
+            prefix = tree.path(category.id)
+            category_query = filters.apply(query.where(
+                ProductListing.category_path >= prefix,
+                ProductListing.category_path < prefix[:-1] + '0',
+            ))
+            return dumps(await fetch_page(session, category_query, keys, cursor, limit, filters.sort))
+
+    key = f'listing:{category_slug}:{cursor}:{limit}:{fields}:{filters.key()}'
+    return await cached_response(request, key, ['listings', f'listing:{category_slug}'], load)
+
+@router.get('/detail/{product_slug}', response_model=ProductOut)
+async def product_detail(product_slug: str, request: Request):
+    async def load() -> bytes:
+        query = select(*PRODUCT_FIELDS.values()).where(Product.slug == product_slug, Product.is_active == True)
+        async with read_session(request) as session:
+            product = (await session.execute(query)).mappings().one_or_none()
+        if not product:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="There is no product found")
+        return dumps(dict(product))
+
+    key = f'product:{product_slug}'
+    return await cached_response(request, key, [key], load)
 
 
 @router.put('/{product_slug}')
@@ -113,17 +468,23 @@ async def update_product(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="There is no product found")
     if user.get('is_supplier') and old_product.user_id != user.get('id'):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to use this method")
+    slug = slugify(product.name)
     query = update(Product).where(Product.slug == product_slug).values(
         category_id=product.category,
         name=product.name,
-        slug=slugify(product.name),
+        slug=slug,
         description=product.description,
         price=product.price,
         image_url=product.image_url,
         stock=product.stock
     )
+    old_category_id = old_product.category_id
+    old_state = (old_product.category_id, old_product.price, old_product.stock)
     await session.execute(query)
+    await session.execute(refresh_listing(session.bind.dialect.name, Product.id == old_product.id))
     await session.commit()
+    facet_index.move(old_state, (product.category, product.price, product.stock))
+    await invalidate_products([product_slug, slug], [old_category_id, product.category])
 
     return {'status_code': status.HTTP_200_OK,
         'transaction': 'Product update is successful'}
@@ -140,6 +501,11 @@ async def delete_product(product_id: int,
     if user.get('is_supplier') and product.user_id != user.get('id'):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to use this method")
     query = update(Product).where(Product.id == product_id).values(is_active=False)
+    slug, category_id = product.slug, product.category_id
+    old_state = (product.category_id, product.price, product.stock)
     await session.execute(query)
+    await session.execute(refresh_listing(session.bind.dialect.name, Product.id == product_id))
     await session.commit()
+    facet_index.move(old_state, None)
+    await invalidate_products([slug], [category_id])
     return {'status_code': status.HTTP_200_OK, 'transaction': 'Product delete is successful'}
@@ -1,46 +1,169 @@
+from collections import Counter
+from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, insert, update
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, insert, update, case, cast, func, and_, bindparam, literal, tuple_, Numeric
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 from starlette import status
 
-from app.backend.db_depends import get_db
-from app.models import Review, Product, User
+from app.backend.cache import invalidate_products
+from app.backend.db import async_session_maker
+from app.backend.db_depends import get_db, get_read_db
+from app.backend.listing import refresh_listing
+from app.backend.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor
+from app.backend.responses import FastJSONResponse
+from app.backend.write_behind import write_behind
+from app.models import Review, ReviewGradeCount, Product, User
 from app.routers.auth import get_customer_user, get_admin_user
-from app.schemas import CreateReview
+from app.schemas import CreateReview, ReviewOut, ReviewPage, ReviewSummary
 
 router = APIRouter(prefix="/review", tags=["review"])
 
+REVIEW_COLUMNS = [Review.__table__.c[name] for name in ReviewOut.model_fields]
 
-@router.get("/")
-async def all_reviews(session: Annotated[AsyncSession, Depends(get_db)]):
-    query = select(Review).where(Review.is_active == True).order_by(Review.creation_date)
-    reviews = await session.scalars(query)
-    reviews = reviews.all()
-    if not reviews:
+
+def update_rating(product_id, count_delta, grade_delta):
+    '''Атомарно сдвигает агрегаты отзывов товара и пересчитывает rating из них'''
+    review_count = Product.review_count + count_delta
+    grade_sum = Product.grade_sum + grade_delta
+    return update(Product).where(Product.id == product_id).values(
+        review_count=review_count,
+        grade_sum=grade_sum,
+        rating=case(
+            (review_count > 0, func.round(cast(grade_sum, Numeric) / review_count, 1)),
+            else_=0
+        )
+    )
+
+
+def shift_grade_counts(dialect: str):
+    '''Сдвигает счётчики оценок на count из параметров; строка создаётся при первом отзыве с этой оценкой'''
+    dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    query = dialect_insert(ReviewGradeCount)
+    return query.on_conflict_do_update(
+        index_elements=[ReviewGradeCount.product_id, ReviewGradeCount.grade],
+        set_={'count': ReviewGradeCount.count + query.excluded.count},
+    )
+
+
+def merge_grades(old: Counter, new: Counter) -> Counter:
+    old.update(new)
+    return old
+
+
+async def flush_review_stats(batch: dict[int, Counter]) -> list:
+    '''Применяет накопленные сдвиги оценок по товарам: два executemany на всю пачку в одной транзакции.
+
+    Возвращает slug и категории товаров для сброса кэша в after_review_stats.
+    '''
+    ratings = [
+        {'product_id': product_id, 'count_delta': sum(grades.values()),
+         'grade_delta': sum(grade * delta for grade, delta in grades.items())}
+        for product_id, grades in batch.items()
+    ]
+    counts = [
+        {'product_id': product_id, 'grade': grade, 'count': delta}
+        for product_id, grades in batch.items() for grade, delta in grades.items() if delta
+    ]
+    async with async_session_maker() as session:
+        connection = await session.connection()
+        await connection.execute(
+            update_rating(bindparam('product_id'), bindparam('count_delta'), bindparam('grade_delta')), ratings
+        )
+        if counts:
+            await connection.execute(shift_grade_counts(connection.dialect.name), counts)
+        await connection.execute(refresh_listing(connection.dialect.name, Product.id.in_(batch)))
+        products = (await session.execute(
+            select(Product.slug, Product.category_id).where(Product.id.in_(batch))
+        )).all()
+        await session.commit()
+    return products
+
+
+async def after_review_stats(products: list):
+    # rating и review_count входят и в карточку, и в листинги
+    await invalidate_products([product.slug for product in products], {product.category_id for product in products})
+
+
+write_behind.register('review_stats', flush_review_stats, merge_grades, after_review_stats)
+
+
+def after_cursor(cursor: str | None):
+    '''Условие ленты "после курсора" по ключу (creation_date, id)'''
+    if not cursor:
+        return True
+    creation_date, review_id = decode_cursor(cursor, 2)
+    try:
+        creation_date = datetime.fromisoformat(creation_date)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    return tuple_(Review.creation_date, Review.id) > (creation_date, review_id)
+
+
+def review_page(rows: list, limit: int) -> dict:
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['creation_date'], rows[-1]['id'])
+    return {'items': [{column.name: row[column.name] for column in REVIEW_COLUMNS} for row in rows],
+            'next_cursor': next_cursor}
+
+
+@router.get("/", response_model=ReviewPage)
+async def all_reviews(
+        session: Annotated[AsyncSession, Depends(get_read_db)],
+        cursor: str | None = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    query = select(*REVIEW_COLUMNS).where(Review.is_active == True, after_cursor(cursor)).order_by(
+        Review.creation_date, Review.id
+    ).limit(limit + 1)
+    reviews = (await session.execute(query)).mappings().all()
+    if not reviews and cursor is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No reviews found")
-    return reviews
+    return FastJSONResponse(review_page(reviews, limit))
 
 
-@router.get("/{product_id}")
+@router.get("/{product_id}", response_model=ReviewPage)
 async def product_reviews(
-        session: Annotated[AsyncSession, Depends(get_db)],
-        product_id: int
+        session: Annotated[AsyncSession, Depends(get_read_db)],
+        product_id: int,
+        cursor: str | None = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
 ):
-    query = select(Product).where(Product.id == product_id)
-    product = await session.scalar(query)
-    if not product:
+    # Товар присоединяется слева: нет строк - нет товара, одна строка с пустым отзывом - нет отзывов
+    query = select(Product.id.label('found'), *REVIEW_COLUMNS).select_from(Product).outerjoin(
+        Review, and_(Review.product_id == Product.id, Review.is_active == True, after_cursor(cursor))
+    ).where(Product.id == product_id).order_by(Review.creation_date, Review.id).limit(limit + 1)
+    rows = (await session.execute(query)).mappings().all()
+    if not rows:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    return FastJSONResponse(review_page([row for row in rows if row['id'] is not None], limit))
+
 
-    query = select(Review).where(
-        Review.is_active == True,
-        Review.product_id == product_id
-    ).order_by(Review.creation_date)
-    reviews = await session.scalars(query)
-    reviews = reviews.all()
-    return reviews
+@router.get("/{product_id}/summary", response_model=ReviewSummary)
+async def product_review_summary(
+        session: Annotated[AsyncSession, Depends(get_read_db)],
+        product_id: int,
+):
+    '''Гистограмма оценок из review_grade_counts: не больше шести строк при любом числе отзывов'''
+    query = select(
+        Product.rating, Product.review_count, ReviewGradeCount.grade, ReviewGradeCount.count
+    ).select_from(Product).outerjoin(ReviewGradeCount, ReviewGradeCount.product_id == Product.id).where(
+        Product.id == product_id
+    )
+    rows = (await session.execute(query)).all()
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    counts = {row.grade: row.count for row in rows if row.grade is not None}
+    return FastJSONResponse({
+        'product_id': product_id,
+        'rating': rows[0].rating or 0.0,
+        'review_count': rows[0].review_count,
+        'grades': [{'grade': grade, 'count': counts.get(grade, 0)} for grade in range(6)],
+    })
 
 
 @router.post("/")
@@ -49,23 +172,19 @@ async def add_review(
         review: CreateReview,
         user: Annotated[User, Depends(get_customer_user)],
 ):
-    query = select(Product).options(joinedload(Product.reviews)).where(Product.is_active == True)
-    product = await session.scalar(query)
-    if not product:
+    # INSERT ... SELECT заодно проверяет, что товар существует и активен: нет товара - нет строки
+    query = insert(Review).from_select(
+        ['comment', 'grade', 'product_id', 'user_id'],
+        select(literal(review.comment), literal(review.grade), Product.id, literal(user.get('id'))).where(
+            Product.id == review.product_id, Product.is_active == True
+        )
+    ).returning(Review.id)
+    if await session.scalar(query) is None:
+        await session.rollback()
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-    reviews = [review for review in product.reviews if review.is_active == True]
-    grade_sum = sum([review.grade for review in reviews]) + review.grade
-    grade = round(grade_sum / (len(reviews) + 1), 1)
-
-    query = insert(Review).values(
-        comment=review.comment,
-        grade=review.grade,
-        product_id=review.product_id,
-        user_id=user.get('id')
-    )
-    await session.execute(query)
-    await session.execute(update(Product).where(Product.id == product.id).values(rating=grade))
     await session.commit()
+    # Агрегаты товара, гистограмма и сброс кэша - вне запроса, пачками по товарам
+    write_behind.enqueue('review_stats', review.product_id, Counter({review.grade: 1}))
     return {'status_code': status.HTTP_201_CREATED, 'transaction': 'Successful'}
 
 
@@ -75,22 +194,10 @@ async def delete_review(
         review_id: int,
         _: Annotated[User, Depends(get_admin_user)]
 ):
-    query = select(Review).where(Review.id == review_id, Review.is_active == True)
-    review = await session.scalar(query)
+    delete_query = update(Review).where(Review.id == review_id, Review.is_active == True).values(is_active=False)
+    review = (await session.execute(delete_query.returning(Review.product_id, Review.grade))).one_or_none()
     if not review:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Review not found")
-    delete_query = update(Review).where(Review.id == review_id).values(is_active=False)
-
-    reviews_query = select(Review).where(
-        Review.is_active == True,
-        Review.product_id == review.product_id,
-        Review.id != review.id)
-    reviews = await session.scalars(reviews_query)
-    reviews = reviews.all()
-    rating = round(sum([review.grade for review in reviews]) / len(reviews), 1)
-    update_rating_query = update(Product).where(Product.id == review.product_id).values(rating=rating)
-
-    await session.execute(delete_query)
-    await session.execute(update_rating_query)
     await session.commit()
+    write_behind.enqueue('review_stats', review.product_id, Counter({review.grade: -1}))
     return {'status_code': status.HTTP_200_OK, 'transaction': 'Successful'}
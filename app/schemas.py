@@ -51,3 +51,146 @@ class CreateReview(BaseModel):
         if v < 0 or v > 5:
             raise ValueError('Grade must be between 0 and 5')
         return v
+
+
+class ProductOut(BaseModel):
+    '''Товар в ответах API.
+
+    Колонки products допускают NULL, а карточка, батч, поиск и выгрузка отдают строки как есть, поэтому
+    name, slug, price, stock и rating могут прийти null. В листингах name, price и rating всегда заполнены.
+    '''
+    id: int
+    name: str | None = None
+    slug: str | None = None
+    description: str | None = None
+    price: int | None = None
+    image_url: str | None = None
+    stock: int | None = None
+    rating: float | None = None
+    review_count: int
+    is_active: bool
+    category_id: int | None = None
+    user_id: int | None = None
+
+
+class ProductPage(BaseModel):
+    '''Страница списка товаров; при fields= в items приходят только запрошенные поля'''
+    items: list[ProductOut]
+    next_cursor: str | None = None
+
+
+class ProductBatch(BaseModel):
+    '''Товары в порядке запроса и ключи, по которым активного товара нет'''
+    items: list[ProductOut]
+    missing: list[str | int]
+
+
+class CategoryFacet(BaseModel):
+    slug: str
+    name: str
+    count: int
+
+
+class PriceFacet(BaseModel):
+    min: int
+    max: int | None = None
+    count: int
+
+
+class Facets(BaseModel):
+    '''Число товаров в категории, по её дочерним категориям и ценовым корзинам'''
+    total: int
+    categories: list[CategoryFacet]
+    price: list[PriceFacet]
+
+
+class CategoryOut(BaseModel):
+    '''Категория в ответах API'''
+    id: int
+    name: str
+    slug: str
+    is_active: bool
+    parent_id: int | None = None
+
+
+class ReviewOut(BaseModel):
+    '''Отзыв в ответах API'''
+    id: int
+    comment: str | None = None
+    creation_date: datetime
+    grade: int
+    is_active: bool
+    product_id: int
+    user_id: int
+
+
+class ReviewPage(BaseModel):
+    '''Страница ленты отзывов по (creation_date, id)'''
+    items: list[ReviewOut]
+    next_cursor: str | None = None
+
+
+class GradeCount(BaseModel):
+    grade: int
+    count: int
+
+
+class ReviewSummary(BaseModel):
+    '''Рейтинг товара и число активных отзывов по каждой оценке'''
+    product_id: int
+    rating: float
+    review_count: int
+    grades: list[GradeCount]
+
+
+class CartItemIn(BaseModel):
+    '''Позиция, добавляемая в корзину'''
+    product_id: int
+    quantity: int = Field(1, ge=1)
+
+
+class CartItemOut(BaseModel):
+    '''Позиция корзины вместе с текущими ценой и остатком товара'''
+    product_id: int
+    name: str
+    slug: str
+    price: int
+    stock: int
+    quantity: int
+
+
+class OrderItemOut(BaseModel):
+    '''Позиция заказа по цене на момент оформления'''
+    product_id: int
+    quantity: int
+    price: int
+
+
+class OrderOut(BaseModel):
+    '''Заказ в ответах API'''
+    id: int
+    status: str
+    total: int
+    creation_date: datetime
+    user_id: int
+    items: list[OrderItemOut] = []
+
+
+class ImportRowError(BaseModel):
+    '''Строка файла импорта, которая не была записана'''
+    row: int
+    detail: str
+
+
+class ImportReport(BaseModel):
+    '''Итог массового импорта товаров'''
+    processed: int
+    imported: int
+    failed: int
+    errors: list[ImportRowError]
+
+
+class SearchPage(BaseModel):
+    '''Страница результатов поиска, отсортированных по релевантности'''
+    items: list[ProductOut]
+    next_offset: int | None = None
@@ -0,0 +1,31 @@
+"""Offline benchmarks for the API.
+
+Importing the package points the app at a throwaway SQLite database unless
+DB_URL is already set, so every script here runs without external services.
+Set DB_URL (e.g. postgresql+asyncpg://...) to benchmark a local Postgres instead;
+benchmarks.seed drops all tables first, so it asks for --force on such a database.
+"""
+import os
+import tempfile
+
+from sqlalchemy import URL, make_url
+
+TEMP_DB_FILE = None
+if 'DB_URL' not in os.environ:
+    TEMP_DB_FILE = tempfile.NamedTemporaryFile(prefix='bench-', suffix='.db', delete=False).name
+    os.environ['DB_URL'] = f'sqlite+aiosqlite:///{TEMP_DB_FILE}'
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key-of-at-least-32-bytes')
+os.environ.setdefault('ALGORITHM', 'HS256')
+
+
+def is_temporary(url: str | URL) -> bool:
+    '''Временная база, созданная этим пакетом, или SQLite в памяти - их не жалко пересоздать'''
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite':
+        return False
+    return url.database in (None, '', ':memory:') or (TEMP_DB_FILE is not None and url.database == TEMP_DB_FILE)
+
+
+def cleanup():
+    if TEMP_DB_FILE and os.path.exists(TEMP_DB_FILE):
+        os.unlink(TEMP_DB_FILE)
@@ -0,0 +1,14 @@
+"""Seed a synthetic catalog, drive the API with a request mix and print the report.
+
+    python -m benchmarks --products 100000 --reviews 1000000 --depth 5 --mix mixed --requests 10000
+"""
+import argparse
+import asyncio
+
+from benchmarks.load import add_load_arguments, main
+from benchmarks.seed import add_arguments
+
+parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.splitlines()[0])
+add_arguments(parser)
+add_load_arguments(parser)
+raise SystemExit(asyncio.run(main(parser.parse_args())))
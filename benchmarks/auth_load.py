@@ -0,0 +1,81 @@
+"""p99 latency of GET /v1/products/ while /v1/auth/token is under load.
+
+Runs fully in-process against a temporary SQLite database:
+
+    python -m benchmarks.auth_load --logins 200 --reads 300
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import benchmarks
+import httpx
+from sqlalchemy import insert
+
+from app.backend.db import engine
+from app.backend.hashing import bcrypt_context
+from app.main import app
+from app.models import Base, Category, Product, User
+from benchmarks.report import percentile
+
+PASSWORD = 'benchmark-password'
+
+
+async def seed(products: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User).values(username='bench', email='bench@example.com',
+                                               hashed_password=bcrypt_context.hash(PASSWORD)))
+        await conn.execute(insert(Category).values(id=1, name='Bench', slug='bench'))
+        await conn.execute(insert(Product), [
+            {'name': f'Product {i}', 'slug': f'product-{i}', 'description': 'x' * 200, 'price': i,
+             'image_url': '', 'stock': 10, 'rating': 0, 'category_id': 1}
+            for i in range(products)
+        ])
+
+
+async def login_worker(client: httpx.AsyncClient, count: int, statuses: list[int]):
+    for _ in range(count):
+        response = await client.post('/v1/auth/token', data={'username': 'bench', 'password': PASSWORD})
+        statuses.append(response.status_code)
+
+
+async def read_worker(client: httpx.AsyncClient, count: int, latencies: list[float]):
+    for _ in range(count):
+        started = time.perf_counter()
+        await client.get('/v1/products/')
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def main(args):
+    await seed(args.products)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        baseline: list[float] = []
+        await read_worker(client, args.reads, baseline)
+
+        latencies: list[float] = []
+        statuses: list[int] = []
+        per_worker = max(1, args.logins // args.concurrency)
+        await asyncio.gather(
+            read_worker(client, args.reads, latencies),
+            *(login_worker(client, per_worker, statuses) for _ in range(args.concurrency)),
+        )
+
+    print(f'GET /v1/products/ idle:       p50={statistics.median(baseline):.1f}ms '
+          f'p99={percentile(baseline, 0.99):.1f}ms')
+    print(f'GET /v1/products/ under load: p50={statistics.median(latencies):.1f}ms '
+          f'p99={percentile(latencies, 0.99):.1f}ms')
+    print(f'POST /v1/auth/token: {statuses.count(200)} ok, {statuses.count(503)} rejected (503)')
+    await engine.dispose()
+    benchmarks.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--reads', type=int, default=200)
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
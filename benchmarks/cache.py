@@ -0,0 +1,82 @@
+"""Latency of GET /v1/products/detail/{slug} with the response cache off and on.
+
+Runs fully in-process against a temporary SQLite database (or DB_URL):
+
+    python -m benchmarks.cache --products 1000 --requests 2000 --hot 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import benchmarks
+import httpx
+from sqlalchemy import insert
+
+from app.backend.cache import response_cache, CACHE_TTL
+from app.backend.db import engine
+from app.main import app
+from app.models import Base, Category, Product, User
+from benchmarks.report import percentile
+
+
+async def seed(products: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User).values(id=1, username='bench', email='bench@example.com', hashed_password=''))
+        await conn.execute(insert(Category).values(id=1, name='Bench', slug='bench'))
+        await conn.execute(insert(Product), [
+            {'name': f'Product {i}', 'slug': f'product-{i}', 'description': 'x' * 500, 'price': i,
+             'image_url': '', 'stock': 10, 'rating': 0, 'category_id': 1, 'user_id': 1}
+            for i in range(products)
+        ])
+
+
+async def run(client: httpx.AsyncClient, slugs: list[str], concurrency: int) -> list[float]:
+    latencies: list[float] = []
+    queue = list(slugs)
+
+    async def worker():
+        while queue:
+            slug = queue.pop()
+            started = time.perf_counter()
+            response = await client.get(f'/v1/products/detail/{slug}')
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def report(label: str, latencies: list[float], elapsed: float):
+    print(f'{label:<10} rps={len(latencies) / elapsed:8.1f}  p50={statistics.median(latencies):6.2f}ms  '
+          f'p99={percentile(latencies, 0.99):6.2f}ms')
+
+
+async def main(args):
+    await seed(args.products)
+    rng = random.Random(args.seed)
+    # Горячий набор товаров, как у реальной витрины: большая часть запросов в несколько карточек
+    slugs = [f'product-{rng.randrange(args.hot)}' for _ in range(args.requests)]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        for label, ttl in (('no cache', 0), ('cache', args.ttl)):
+            response_cache.ttl = ttl
+            started = time.perf_counter()
+            latencies = await run(client, slugs, args.concurrency)
+            report(label, latencies, time.perf_counter() - started)
+    print(response_cache.stats())
+    await engine.dispose()
+    benchmarks.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--hot', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--ttl', type=float, default=CACHE_TTL or 30)
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""Concurrent checkouts of the same SKU: proves there is no overselling and reports checkouts/s.
+
+Every buyer has the hot product (and one of a few cold ones) in the cart and all of them
+call POST /v1/orders/checkout at once. Exits with status 1 if stock went negative or the
+sold quantity does not match the orders:
+
+    python -m benchmarks.checkout --buyers 300 --stock 100 --concurrency 100
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import timedelta
+
+import benchmarks
+import httpx
+from sqlalchemy import insert, select, func
+
+from app.backend.db import engine
+from app.main import app
+from app.models import Base, CartItem, Category, OrderItem, Order, Product, User
+from app.routers.auth import create_access_token
+
+HOT_PRODUCT = 1
+COLD_PRODUCTS = 5
+
+
+async def seed(args) -> dict[int, int]:
+    rng = random.Random(args.seed)
+    stock = {HOT_PRODUCT: args.stock, **{HOT_PRODUCT + i: args.buyers * 3 for i in range(1, COLD_PRODUCTS + 1)}}
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [
+            {'id': i, 'username': f'buyer-{i}', 'email': f'buyer-{i}@example.com', 'hashed_password': '',
+             'is_customer': True}
+            for i in range(1, args.buyers + 1)
+        ])
+        await conn.execute(insert(Category).values(id=1, name='Sale', slug='sale'))
+        await conn.execute(insert(Product), [
+            {'id': product_id, 'name': f'Product {product_id}', 'slug': f'product-{product_id}', 'price': 100,
+             'stock': count, 'category_id': 1, 'is_active': True}
+            for product_id, count in stock.items()
+        ])
+        await conn.execute(insert(CartItem), [
+            {'user_id': user_id, 'product_id': product_id, 'quantity': rng.randint(1, args.max_quantity)}
+            for user_id in range(1, args.buyers + 1)
+            for product_id in (HOT_PRODUCT, rng.randint(HOT_PRODUCT + 1, HOT_PRODUCT + COLD_PRODUCTS))
+        ])
+    return stock
+
+
+async def verify(initial: dict[int, int]) -> list[str]:
+    errors = []
+    async with engine.connect() as conn:
+        stock = dict((await conn.execute(select(Product.id, Product.stock))).all())
+        sold = dict((await conn.execute(
+            select(OrderItem.product_id, func.sum(OrderItem.quantity)).group_by(OrderItem.product_id)
+        )).all())
+        totals_match = await conn.scalar(select(func.count()).select_from(Order).where(
+            Order.total != select(func.sum(OrderItem.price * OrderItem.quantity))
+            .where(OrderItem.order_id == Order.id).scalar_subquery()
+        ))
+    for product_id, count in initial.items():
+        if stock[product_id] < 0:
+            errors.append(f'product {product_id}: negative stock {stock[product_id]}')
+        if count - stock[product_id] != sold.get(product_id, 0):
+            errors.append(f'product {product_id}: stock dropped by {count - stock[product_id]}, '
+                          f'orders have {sold.get(product_id, 0)}')
+    if totals_match:
+        errors.append(f'{totals_match} orders with a total that does not match their items')
+    return errors
+
+
+async def main(args) -> int:
+    initial = await seed(args)
+    headers = [
+        {'Authorization': 'Bearer ' + await create_access_token(f'buyer-{i}', i, False, False, True,
+                                                                 timedelta(minutes=30))}
+        for i in range(1, args.buyers + 1)
+    ]
+    statuses: list[int] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def buy(client: httpx.AsyncClient, buyer_headers: dict):
+        async with semaphore:
+            response = await client.post('/v1/orders/checkout', headers=buyer_headers)
+            statuses.append(response.status_code)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(buy(client, buyer_headers) for buyer_headers in headers))
+        elapsed = time.perf_counter() - started
+
+    errors = await verify(initial)
+    print(f'{len(statuses)} checkouts in {elapsed:.2f}s: {len(statuses) / elapsed:.1f} checkouts/s')
+    print(f'201 created: {statuses.count(201)}, 409 out of stock: {statuses.count(409)}, '
+          f'other: {len(statuses) - statuses.count(201) - statuses.count(409)}')
+    for error in errors:
+        print('FAIL', error)
+    if not errors:
+        print('ok: no overselling, stock matches the orders')
+    await engine.dispose()
+    benchmarks.cleanup()
+    return 1 if errors or statuses.count(201) + statuses.count(409) != len(statuses) else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--buyers', type=int, default=300)
+    parser.add_argument('--stock', type=int, default=100, help='stock of the hot product')
+    parser.add_argument('--max-quantity', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,124 @@
+"""Checks that every read query issued by the routers is served by an index.
+
+Calls the GET routes and the login route in-process, captures the SQL they emit and runs EXPLAIN
+for each statement. Exits with status 1 if any statement falls back to a full
+table scan. Works against SQLite (default, temporary file) or Postgres (DB_URL):
+
+    python -m benchmarks.explain
+"""
+import asyncio
+import sys
+
+import benchmarks
+import httpx
+from sqlalchemy import event, insert, text
+
+from app.backend.db import engine
+from app.backend.hashing import bcrypt_context
+from app.backend.listing import rebuild_listing
+from app.main import app
+from app.models import Base, Category, Product, Review, User
+
+ROUTES = [
+    '/v1/products/',
+    '/v1/products/root',
+    '/v1/products/?sort=-price',
+    '/v1/products/?sort=rating&in_stock=false',
+    '/v1/products/root?sort=price&price_max=500&min_rating=1',
+    '/v1/products/detail/product-1',
+    '/v1/products/batch?slug=product-2&slug=product-3&slug=missing',
+    '/v1/products/batch?id=4&id=5',
+    '/v1/products/search?q=product+1',
+    '/v1/products/search?q=prod&category=root&price_max=500',
+    '/v1/review/',
+    '/v1/review/1',
+    '/v1/review/1?limit=10&cursor=WyIyMDI0LTAxLTAxIDAwOjAwOjAwIiwxMF0',
+    '/v1/review/1/summary',
+]
+
+# Дерево категорий целиком загружается в память одним запросом, полный проход здесь ожидаем
+FULL_SCAN_ALLOWED = {'categories'}
+
+
+async def seed():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User).values(id=1, username='explain', email='explain@example.com',
+                                               hashed_password=bcrypt_context.hash('explain', rounds=4)))
+        await conn.execute(insert(Category).values(id=1, name='Root', slug='root'))
+        await conn.execute(insert(Product), [
+            {'id': i, 'name': f'Product {i}', 'slug': f'product-{i}', 'price': i, 'stock': i % 5,
+             'category_id': 1, 'user_id': 1, 'is_active': i % 7 != 0}
+            for i in range(1, 1001)
+        ])
+        await conn.execute(insert(Review), [
+            {'product_id': 1 + i % 1000, 'user_id': 1, 'grade': i % 6, 'is_active': i % 9 != 0}
+            for i in range(5000)
+        ])
+        await rebuild_listing(conn)
+        if engine.dialect.name == 'postgresql':
+            await conn.execute(text('ANALYZE'))
+
+
+def capture_statements() -> list[tuple[str, tuple]]:
+    statements = []
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    return statements
+
+
+def full_scans(plan: list[str], dialect: str) -> list[str]:
+    if dialect == 'sqlite':
+        # SCAN <table> без USING INDEX означает полный проход по таблице;
+        # SCAN по FTS5 (VIRTUAL TABLE INDEX) - это поиск по полнотекстовому индексу
+        scans = [line for line in plan if line.startswith('SCAN') and 'USING' not in line
+                 and 'VIRTUAL TABLE INDEX' not in line]
+    else:
+        scans = [line for line in plan if 'Seq Scan' in line]
+    return [line for line in scans if not any(table in line.split() for table in FULL_SCAN_ALLOWED)]
+
+
+async def explain(statements: list[tuple[str, tuple]]) -> int:
+    dialect = engine.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    failures = 0
+    async with engine.connect() as conn:
+        if dialect == 'postgresql':
+            # Проверяем, что индекс применим, а не что планировщик выбрал его на маленькой выборке
+            await conn.exec_driver_sql('SET enable_seqscan = off')
+        for statement, parameters in statements:
+            rows = await conn.exec_driver_sql(prefix + statement, parameters)
+            plan = [row[-1] for row in rows]
+            scans = full_scans(plan, dialect)
+            failures += bool(scans)
+            print('FAIL' if scans else 'ok  ', ' '.join(statement.split())[:110])
+            for line in plan:
+                print('        ', line)
+    return failures
+
+
+async def main() -> int:
+    await seed()
+    statements = capture_statements()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://explain') as client:
+        for route in ROUTES:
+            response = await client.get(route)
+            assert response.status_code == 200, (route, response.status_code)
+        response = await client.post('/v1/auth/token', data={'username': 'explain', 'password': 'explain'})
+        assert response.status_code == 200, ('/v1/auth/token', response.status_code)
+    failures = await explain(list(dict.fromkeys(
+        (statement, tuple(parameters) if isinstance(parameters, (list, tuple)) else parameters)
+        for statement, parameters in statements
+    )))
+    await engine.dispose()
+    benchmarks.cleanup()
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.run(main()) else 0)
@@ -0,0 +1,84 @@
+"""Memory and time to first byte of GET /v1/products/export on a large catalog.
+
+Calls the ASGI app directly and discards the body as it arrives, so the numbers
+reflect the server side only. Peak memory is measured with tracemalloc:
+
+    python -m benchmarks.export --products 200000 --format csv
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+import benchmarks
+from sqlalchemy import insert
+
+from app.backend.db import engine
+from app.main import app
+from app.models import Base, Category, Product
+
+
+async def seed(products: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Category).values(id=1, name='Export', slug='export-root'))
+        for start in range(0, products, 10_000):
+            await conn.execute(insert(Product), [
+                {'name': f'Product {i}', 'slug': f'product-{i}', 'description': 'x' * 200, 'price': i,
+                 'image_url': '', 'stock': i % 10, 'rating': 0, 'category_id': 1, 'is_active': True}
+                for i in range(start, min(start + 10_000, products))
+            ])
+
+
+async def export(fmt: str) -> dict:
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': '/v1/products/export', 'raw_path': b'/v1/products/export', 'root_path': '',
+        'query_string': f'format={fmt}'.encode(), 'headers': [(b'host', b'bench')],
+        'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+    }
+    stats = {'status': None, 'first_byte': None, 'bytes': 0, 'chunks': 0}
+    started = time.perf_counter()
+
+    requested = asyncio.Event()
+
+    async def receive():
+        if not requested.is_set():
+            requested.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Клиент не отключается: ждём, пока ответ не будет отправлен целиком
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            stats['status'] = message['status']
+        elif message['type'] == 'http.response.body' and message.get('body'):
+            if stats['first_byte'] is None:
+                stats['first_byte'] = time.perf_counter() - started
+            stats['bytes'] += len(message['body'])
+            stats['chunks'] += 1
+
+    await app(scope, receive, send)
+    stats['total'] = time.perf_counter() - started
+    return stats
+
+
+async def main(args):
+    await seed(args.products)
+    tracemalloc.start()
+    stats = await export(args.format)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"status={stats['status']} rows={args.products} body={stats['bytes'] / 2 ** 20:.1f}MiB "
+          f"chunks={stats['chunks']}")
+    print(f"first byte {stats['first_byte'] * 1000:.1f}ms, total {stats['total']:.2f}s, "
+          f"peak python memory {peak / 2 ** 20:.1f}MiB")
+    await engine.dispose()
+    benchmarks.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,421 @@
+"""In-process ASGI load driver.
+
+Drives every route of app.main with a weighted request mix through
+httpx.ASGITransport (no network, no uvicorn) and records latency and the number
+of SQL statements per request:
+
+    python -m benchmarks.load --mix browse --requests 5000 --concurrency 32
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import benchmarks
+import httpx
+import orjson
+from sqlalchemy import event
+
+from app.backend.db import engine, replica_engine
+from app.main import app
+from app.routers.auth import create_access_token
+from benchmarks.report import Sample, compare, print_report, save, summarize
+from benchmarks.seed import ADJECTIVES, NOUNS, PASSWORD, Dataset, add_arguments, config_from_args, seed
+
+_statements: contextvars.ContextVar[list | None] = contextvars.ContextVar('bench_statements', default=None)
+
+
+def count_statements(db_engine):
+    @event.listens_for(db_engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter = _statements.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+@dataclass
+class Context:
+    dataset: Dataset
+    headers: dict[str, dict]
+    sequence: itertools.count = field(default_factory=lambda: itertools.count(1))
+    categories: list[str] = field(default_factory=list)
+    products: list[str] = field(default_factory=list)
+    # Заголовки нескольких покупателей: у каждого своя корзина
+    customers: list[dict] = field(default_factory=list)
+    # Что каждый покупатель положил в корзину: правки и оформление идут по непустым корзинам
+    carts: dict[int, set[int]] = field(default_factory=dict)
+    checkouts: int = 0
+    # ETag последнего ответа по запросу: с --revalidate клиент повторяет GET с If-None-Match
+    revalidate: bool = False
+    etags: dict[str, str] = field(default_factory=dict)
+
+    def customer_id(self, rng: random.Random) -> int:
+        return 2 + self.dataset.suppliers + rng.randrange(self.dataset.customers)
+
+    def cart_product(self, rng: random.Random) -> int:
+        # Корзины собираются из небольшого числа хитов, поэтому правки и удаления находят свои позиции
+        return rng.randint(1, min(self.dataset.products, 10))
+
+    def customer_with_cart(self, rng: random.Random) -> int | None:
+        customers = [customer for customer, products in self.carts.items() if products]
+        return rng.choice(customers) if customers else None
+
+
+# Каждый сценарий возвращает (метка маршрута, метод, url, kwargs для httpx)
+def root(ctx, rng):
+    return 'GET /', 'GET', '/', {}
+
+
+METRICS = ['db-pool', 'cache', 'single-flight', 'auth-tokens', 'write-behind', 'invalidation', 'compression']
+
+
+def metrics(ctx, rng):
+    name = rng.choice(METRICS)
+    return f'GET /metrics/{name}', 'GET', f'/metrics/{name}', {'headers': ctx.headers['admin']}
+
+
+def all_categories(ctx, rng):
+    return 'GET /v1/categories/', 'GET', '/v1/categories/', {}
+
+
+def create_category(ctx, rng):
+    n = next(ctx.sequence)
+    ctx.categories.append(f'bench-category-{n}')
+    body = {'name': f'Bench Category {n}', 'parent_id': rng.randint(1, ctx.dataset.categories)}
+    return 'POST /v1/categories/', 'POST', '/v1/categories/', {'json': body, 'headers': ctx.headers['admin']}
+
+
+def update_category(ctx, rng):
+    if not ctx.categories:
+        return create_category(ctx, rng)
+    n = next(ctx.sequence)
+    old_slug = ctx.categories.pop(rng.randrange(len(ctx.categories)))
+    ctx.categories.append(f'bench-category-{n}')
+    return 'PUT /v1/categories/', 'PUT', '/v1/categories/', {
+        'params': {'category_slug': old_slug}, 'json': {'name': f'Bench Category {n}'},
+        'headers': ctx.headers['admin']}
+
+
+def delete_category(ctx, rng):
+    if not ctx.categories:
+        return create_category(ctx, rng)
+    slug = ctx.categories.pop(rng.randrange(len(ctx.categories)))
+    return 'DELETE /v1/categories/', 'DELETE', '/v1/categories/', {
+        'params': {'category_slug': slug}, 'headers': ctx.headers['admin']}
+
+
+def all_products(ctx, rng):
+    return 'GET /v1/products/', 'GET', '/v1/products/', {'params': {'limit': rng.choice((20, 50, 100))}}
+
+
+def product_by_category(ctx, rng):
+    # Верхние уровни дерева популярнее листьев
+    category_id = min(ctx.dataset.categories, 1 + int(ctx.dataset.categories * rng.random() ** 2))
+    return 'GET /v1/products/{category_slug}', 'GET', f'/v1/products/category-{category_id}', {}
+
+
+def product_detail(ctx, rng):
+    product_id = min(ctx.dataset.products, 1 + int(ctx.dataset.products * rng.random() ** 3))
+    return 'GET /v1/products/detail/{slug}', 'GET', f'/v1/products/detail/product-{product_id}', {}
+
+
+def products_batch(ctx, rng):
+    # Корзина или блок рекомендаций: несколько десятков карточек одним запросом
+    product_ids = {min(ctx.dataset.products, 1 + int(ctx.dataset.products * rng.random() ** 3))
+                   for _ in range(rng.randint(20, 60))}
+    params = [('slug', f'product-{product_id}') for product_id in product_ids]
+    return 'GET /v1/products/batch', 'GET', '/v1/products/batch', {'params': params}
+
+
+def product_facets(ctx, rng):
+    params = {'category': f'category-{rng.randint(1, ctx.dataset.categories)}'} if rng.random() < 0.7 else {}
+    return 'GET /v1/products/facets', 'GET', '/v1/products/facets', {'params': params}
+
+
+def export_products(ctx, rng):
+    # Выгрузка поддерева: весь каталог на каждый запрос превратил бы прогон в тест выгрузки
+    params = {'format': rng.choice(('ndjson', 'csv')), 'category': f'category-{ctx.dataset.categories}'}
+    return 'GET /v1/products/export', 'GET', '/v1/products/export', {'params': params}
+
+
+def search_products(ctx, rng):
+    # Как автодополнение: целое слово и начало следующего
+    noun = rng.choice(NOUNS)
+    q = f'{rng.choice(ADJECTIVES)} {noun[:rng.randint(2, len(noun))]}'
+    return 'GET /v1/products/search', 'GET', '/v1/products/search', {'params': {'q': q}}
+
+
+def product_body(ctx, rng, name: str) -> dict:
+    return {'name': name, 'description': 'Created by the load driver', 'price': rng.randint(100, 100_000),
+            'image_url': 'https://img.bench.local/new.jpg', 'stock': rng.randint(1, 100),
+            'category': rng.randint(1, ctx.dataset.categories)}
+
+
+def create_product(ctx, rng):
+    n = next(ctx.sequence)
+    ctx.products.append(f'bench-product-{n}')
+    return 'POST /v1/products/', 'POST', '/v1/products/', {
+        'json': product_body(ctx, rng, f'Bench Product {n}'), 'headers': ctx.headers['supplier']}
+
+
+def update_product(ctx, rng):
+    if not ctx.products:
+        return create_product(ctx, rng)
+    n = next(ctx.sequence)
+    slug = ctx.products.pop(rng.randrange(len(ctx.products)))
+    ctx.products.append(f'bench-product-{n}')
+    return 'PUT /v1/products/{slug}', 'PUT', f'/v1/products/{slug}', {
+        'json': product_body(ctx, rng, f'Bench Product {n}'), 'headers': ctx.headers['supplier']}
+
+
+def import_products(ctx, rng):
+    n = next(ctx.sequence)
+    rows = rng.randint(10, 50)
+    ctx.products.extend(f'bench-import-{n}-{i}' for i in range(rows))
+    lines = [orjson.dumps(product_body(ctx, rng, f'Bench Import {n} {i}')) for i in range(rows)]
+    file = ('products.ndjson', b'\n'.join(lines), 'application/x-ndjson')
+    return 'POST /v1/products/import', 'POST', '/v1/products/import', {
+        'files': {'file': file}, 'headers': ctx.headers['supplier']}
+
+
+def delete_product(ctx, rng):
+    return 'DELETE /v1/products/', 'DELETE', '/v1/products/', {
+        'params': {'product_id': rng.randint(1, ctx.dataset.products)}, 'headers': ctx.headers['admin']}
+
+
+def users_me(ctx, rng):
+    return 'GET /v1/auth/users/me', 'GET', '/v1/auth/users/me', {
+        'params': {'username': 'customer-1', 'password': PASSWORD}}
+
+
+def create_user(ctx, rng):
+    n = next(ctx.sequence)
+    body = {'first_name': 'Load', 'last_name': 'Driver', 'username': f'bench-user-{n}',
+            'email': f'bench-user-{n}@example.com', 'password': PASSWORD}
+    return 'POST /v1/auth/', 'POST', '/v1/auth/', {'json': body}
+
+
+def login(ctx, rng):
+    username = f'customer-{rng.randint(1, ctx.dataset.customers)}'
+    return 'POST /v1/auth/token', 'POST', '/v1/auth/token', {'data': {'username': username, 'password': PASSWORD}}
+
+
+def read_current_user(ctx, rng):
+    return 'GET /v1/auth/read_current_user', 'GET', '/v1/auth/read_current_user', {
+        'headers': ctx.headers['customer']}
+
+
+def supplier_permission(ctx, rng):
+    return 'PATCH /v1/permission/', 'PATCH', '/v1/permission/', {
+        'params': {'user_id': ctx.customer_id(rng)}, 'headers': ctx.headers['admin']}
+
+
+def delete_user(ctx, rng):
+    return 'DELETE /v1/permission/delete', 'DELETE', '/v1/permission/delete', {
+        'params': {'user_id': ctx.customer_id(rng)}, 'headers': ctx.headers['admin']}
+
+
+def all_reviews(ctx, rng):
+    return 'GET /v1/review/', 'GET', '/v1/review/', {}
+
+
+def product_reviews(ctx, rng):
+    product_id = min(ctx.dataset.products, 1 + int(ctx.dataset.products * rng.random() ** 3))
+    return 'GET /v1/review/{product_id}', 'GET', f'/v1/review/{product_id}', {}
+
+
+def review_summary(ctx, rng):
+    product_id = min(ctx.dataset.products, 1 + int(ctx.dataset.products * rng.random() ** 3))
+    return 'GET /v1/review/{product_id}/summary', 'GET', f'/v1/review/{product_id}/summary', {}
+
+
+def add_review(ctx, rng):
+    body = {'comment': 'Load driver review', 'grade': rng.randint(0, 5),
+            'product_id': rng.randint(1, ctx.dataset.products)}
+    return 'POST /v1/review/', 'POST', '/v1/review/', {'json': body, 'headers': ctx.headers['customer']}
+
+
+def delete_review(ctx, rng):
+    return 'DELETE /v1/review/{product_id}', 'DELETE', '/v1/review/0', {
+        'params': {'review_id': rng.randint(1, max(1, ctx.dataset.reviews))}, 'headers': ctx.headers['admin']}
+
+
+def get_cart(ctx, rng):
+    return 'GET /v1/cart/', 'GET', '/v1/cart/', {'headers': rng.choice(ctx.customers)}
+
+
+def add_to_cart(ctx, rng):
+    customer = rng.randrange(len(ctx.customers))
+    product_id = ctx.cart_product(rng)
+    ctx.carts.setdefault(customer, set()).add(product_id)
+    return 'POST /v1/cart/', 'POST', '/v1/cart/', {
+        'json': {'product_id': product_id, 'quantity': rng.randint(1, 2)}, 'headers': ctx.customers[customer]}
+
+
+def set_cart_quantity(ctx, rng):
+    customer = ctx.customer_with_cart(rng)
+    if customer is None:
+        return add_to_cart(ctx, rng)
+    product_id = rng.choice(sorted(ctx.carts[customer]))
+    return 'PUT /v1/cart/', 'PUT', '/v1/cart/', {
+        'json': {'product_id': product_id, 'quantity': rng.randint(1, 3)}, 'headers': ctx.customers[customer]}
+
+
+def remove_from_cart(ctx, rng):
+    customer = ctx.customer_with_cart(rng)
+    if customer is None:
+        return add_to_cart(ctx, rng)
+    product_id = rng.choice(sorted(ctx.carts[customer]))
+    ctx.carts[customer].discard(product_id)
+    return 'DELETE /v1/cart/{product_id}', 'DELETE', f'/v1/cart/{product_id}', {'headers': ctx.customers[customer]}
+
+
+def checkout(ctx, rng):
+    customer = ctx.customer_with_cart(rng)
+    if customer is None:
+        return add_to_cart(ctx, rng)
+    ctx.carts[customer].clear()
+    ctx.checkouts += 1
+    return 'POST /v1/orders/checkout', 'POST', '/v1/orders/checkout', {'headers': ctx.customers[customer]}
+
+
+def my_orders(ctx, rng):
+    return 'GET /v1/orders/', 'GET', '/v1/orders/', {'headers': rng.choice(ctx.customers)}
+
+
+def order_detail(ctx, rng):
+    order_id = rng.randint(1, max(1, ctx.checkouts))
+    return 'GET /v1/orders/{order_id}', 'GET', f'/v1/orders/{order_id}', {'headers': ctx.headers['admin']}
+
+
+SCENARIOS = [
+    root, metrics,
+    all_categories, create_category, update_category, delete_category,
+    all_products, create_product, product_by_category, product_detail, products_batch, search_products,
+    product_facets, export_products, import_products, update_product, delete_product,
+    users_me, create_user, login, read_current_user,
+    supplier_permission, delete_user,
+    all_reviews, product_reviews, review_summary, add_review, delete_review,
+    get_cart, add_to_cart, set_cart_quantity, remove_from_cart, checkout, my_orders, order_detail,
+]
+
+MIXES = {
+    # Витрина: почти только чтение, горячие карточки и листинги категорий
+    'browse': {
+        product_detail: 40, product_by_category: 20, search_products: 10, all_products: 8, all_categories: 8,
+        product_reviews: 7, review_summary: 2, products_batch: 3, read_current_user: 3, all_reviews: 1, root: 1,
+    },
+    # Витрина плюс типичная доля записи: отзывы, правки поставщиков, логины
+    'mixed': {
+        product_detail: 32, product_by_category: 18, search_products: 8, all_products: 6, all_categories: 7,
+        product_reviews: 7,
+        read_current_user: 5, add_review: 5, create_product: 2, update_product: 2, login: 1,
+        all_reviews: 1, root: 1, delete_review: 1, delete_product: 1, supplier_permission: 1,
+        product_facets: 3, add_to_cart: 3, get_cart: 1, checkout: 1, my_orders: 1,
+    },
+    # Каждый маршрут с равным весом - проверка, что ничего не сломалось и не деградировало
+    'all': {scenario: 1 for scenario in SCENARIOS},
+}
+
+
+async def issue_tokens(dataset: Dataset) -> dict[str, dict]:
+    ttl = timedelta(hours=1)
+    tokens = {
+        'admin': await create_access_token('admin', 1, True, False, False, ttl),
+        'supplier': await create_access_token('supplier-1', 2, False, True, False, ttl),
+        'customer': await create_access_token('customer-1', 2 + dataset.suppliers, False, False, True, ttl),
+    }
+    return {role: {'Authorization': f'Bearer {token}'} for role, token in tokens.items()}
+
+
+async def customer_headers(dataset: Dataset, count: int = 20) -> list[dict]:
+    ttl = timedelta(hours=1)
+    return [
+        {'Authorization': 'Bearer ' + await create_access_token(f'customer-{n}', 1 + dataset.suppliers + n, False,
+                                                                 False, True, ttl)}
+        for n in range(1, min(count, dataset.customers) + 1)
+    ]
+
+
+async def run_load(dataset: Dataset, mix: str, requests: int, concurrency: int, seed_value: int = 0,
+                   warmup: int = 0, revalidate: bool = False) -> tuple[list[Sample], float]:
+    count_statements(engine)
+    if replica_engine is not None:
+        count_statements(replica_engine)
+    ctx = Context(dataset=dataset, headers=await issue_tokens(dataset), revalidate=revalidate,
+                  customers=await customer_headers(dataset))
+    scenarios, weights = zip(*MIXES[mix].items())
+    samples: list[Sample] = []
+    issued = itertools.count()
+
+    async def worker(client: httpx.AsyncClient, rng: random.Random, total: int, record: bool):
+        while next(issued) < total:
+            route, method, url, kwargs = rng.choices(scenarios, weights)[0](ctx, rng)
+            request_key = f"{url}?{kwargs.get('params')}"
+            if ctx.revalidate and method == 'GET' and request_key in ctx.etags:
+                kwargs = {**kwargs, 'headers': {**kwargs.get('headers', {}), 'If-None-Match': ctx.etags[request_key]}}
+            counter = [0]
+            token = _statements.set(counter)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                status = response.status_code
+                if 'etag' in response.headers:
+                    ctx.etags[request_key] = response.headers['etag']
+            except Exception:
+                status = 599
+            finally:
+                _statements.reset(token)
+            if record:
+                samples.append(Sample(route, status, time.perf_counter() - started, counter[0]))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        if warmup:
+            await asyncio.gather(*(worker(client, random.Random(seed_value - n - 1), warmup, False)
+                                   for n in range(concurrency)))
+            issued = itertools.count()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, random.Random(seed_value + n), requests, True)
+                               for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def add_load_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--mix', choices=sorted(MIXES), default='browse')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--revalidate', action='store_true',
+                        help='repeat GETs with If-None-Match, like a returning client')
+    parser.add_argument('--json', help='save the summary to this file')
+    parser.add_argument('--baseline', help='compare with a summary saved earlier via --json')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 growth vs baseline')
+
+
+async def main(args: argparse.Namespace) -> int:
+    dataset = await seed(config_from_args(args))
+    async with app.router.lifespan_context(app):
+        samples, elapsed = await run_load(dataset, args.mix, args.requests, args.concurrency,
+                                          args.seed, args.warmup, args.revalidate)
+    summary = summarize(samples, elapsed)
+    print_report(summary)
+    if args.json:
+        save(summary, args.json)
+    regressions = compare(summary, args.baseline, args.tolerance) if args.baseline else []
+    for line in regressions:
+        print('REGRESSION', line)
+    benchmarks.cleanup()
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    add_load_arguments(parser)
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
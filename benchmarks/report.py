@@ -0,0 +1,75 @@
+"""Aggregation and printing of load-test samples."""
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+
+
+@dataclass
+class Sample:
+    route: str
+    status: int
+    seconds: float
+    queries: int
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict:
+    by_route: dict[str, list[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_route[sample.route].append(sample)
+
+    def stats(items: list[Sample], seconds: float) -> dict:
+        latencies = [item.seconds * 1000 for item in items]
+        return {
+            'requests': len(items),
+            'client_errors': sum(400 <= item.status < 500 for item in items),
+            'errors': sum(item.status >= 500 for item in items),
+            'rps': round(len(items) / seconds, 1) if seconds else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'queries_per_request': round(sum(item.queries for item in items) / len(items), 2) if items else 0.0,
+        }
+
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'total': stats(samples, elapsed),
+        'routes': {route: stats(items, elapsed) for route, items in sorted(by_route.items())},
+    }
+
+
+def print_report(summary: dict):
+    header = f"{'route':45} {'reqs':>6} {'4xx':>4} {'5xx':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'q/req':>6}"
+    print(header)
+    print('-' * len(header))
+    rows = list(summary['routes'].items()) + [('TOTAL', summary['total'])]
+    for route, row in rows:
+        print(f"{route:45} {row['requests']:6} {row['client_errors']:4} {row['errors']:4} {row['rps']:8} {row['p50_ms']:8} "
+              f"{row['p95_ms']:8} {row['p99_ms']:8} {row['queries_per_request']:6}")
+
+
+def save(summary: dict, path: str):
+    with open(path, 'w') as file:
+        json.dump(summary, file, indent=2)
+
+
+def compare(summary: dict, baseline_path: str, tolerance: float) -> list[str]:
+    '''Маршруты, у которых p95 или число запросов к БД выросли сильнее tolerance относительно baseline'''
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    regressions = []
+    for route, row in summary['routes'].items():
+        old = baseline['routes'].get(route)
+        if old is None:
+            continue
+        if old['p95_ms'] and row['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {old['p95_ms']}ms -> {row['p95_ms']}ms")
+        if row['queries_per_request'] > old['queries_per_request'] + 0.01:
+            regressions.append(f"{route}: queries/request {old['queries_per_request']} -> {row['queries_per_request']}")
+    return regressions
@@ -0,0 +1,264 @@
+"""Checks that every route reads from the database it is supposed to: replica or primary.
+
+Runs the app in-process against two SQLite files with the same seed data, one as the primary
+(DB_URL) and one as the replica (DB_REPLICA_URL). The replica never receives the writes, so it
+behaves like a replica that lags forever. Each route is called once and request.state.db_role is
+compared with the expected role. Statements on the replica engine are counted per request, so a
+route that only claims 'replica' is caught too. The response cache stays on:
+
+- right after a write the read-your-writes cookie must pin the replica reads to the primary,
+  past the cache;
+- a client without the cookie reads the invalidated pages from the replica, and those bodies
+  must not be cached (a second identical read goes to the replica again).
+
+Exits with status 1 on any mismatch, or if a route of the app is missing from ROUTES:
+
+    python -m benchmarks.routing
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import benchmarks
+
+REPLICA_DB_FILE = None
+if 'DB_REPLICA_URL' not in os.environ:
+    REPLICA_DB_FILE = tempfile.NamedTemporaryFile(prefix='bench-replica-', suffix='.db', delete=False).name
+    os.environ['DB_REPLICA_URL'] = f'sqlite+aiosqlite:///{REPLICA_DB_FILE}'
+# Кэш включён: проверяется, что он не отдаёт и не запоминает чтения с отстающей реплики
+os.environ['CACHE_TTL'] = '30'
+
+import httpx
+from fastapi.routing import APIRoute
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.backend.db import engine, replica_engine
+from app.backend.db_depends import READ_YOUR_WRITES_COOKIE
+from app.backend.hashing import bcrypt_context
+from app.backend.listing import rebuild_listing
+from app.backend.write_behind import write_behind
+from app.main import app, app_v1
+from app.models import Base, Category, Product, Review, User
+from app.routers.auth import create_access_token
+
+PASSWORD = 'routing'
+
+PRODUCT = {'name': 'Routing Product', 'description': 'd', 'price': 10, 'image_url': '', 'stock': 5, 'category': 1}
+
+
+@dataclass
+class Case:
+    method: str
+    route: str
+    url: str
+    expected: str | None
+    user: str | None = None
+    options: dict = field(default_factory=dict)
+
+
+# Порядок важен: ручки записи готовят данные для следующих (корзина -> заказ, категория -> её удаление)
+ROUTES = [
+    Case('GET', '/', '/', None),
+    *(Case('GET', f'/metrics/{name}', f'/metrics/{name}', None, 'admin')
+      for name in ('db-pool', 'cache', 'single-flight', 'auth-tokens', 'write-behind', 'invalidation', 'compression')),
+
+    Case('GET', '/v1/categories/', '/v1/categories/', 'replica'),
+    Case('POST', '/v1/categories/', '/v1/categories/', 'primary', 'admin', {'json': {'name': 'Routing'}}),
+    Case('PUT', '/v1/categories/', '/v1/categories/?category_slug=routing', 'primary', 'admin',
+         {'json': {'name': 'Routing Two'}}),
+    Case('DELETE', '/v1/categories/', '/v1/categories/?category_slug=routing-two', 'primary', 'admin'),
+
+    Case('GET', '/v1/products/', '/v1/products/', 'replica'),
+    Case('GET', '/v1/products/batch', '/v1/products/batch?slug=product-5&slug=product-6', 'replica'),
+    Case('GET', '/v1/products/facets', '/v1/products/facets', 'replica'),
+    Case('GET', '/v1/products/search', '/v1/products/search?q=product', 'replica'),
+    Case('GET', '/v1/products/export', '/v1/products/export?category=root', 'replica'),
+    Case('GET', '/v1/products/{category_slug}', '/v1/products/root', 'replica'),
+    Case('GET', '/v1/products/detail/{product_slug}', '/v1/products/detail/product-1', 'replica'),
+    Case('POST', '/v1/products/', '/v1/products/', 'primary', 'supplier', {'json': PRODUCT}),
+    Case('POST', '/v1/products/import', '/v1/products/import', 'primary', 'supplier', {'files': {'file': (
+        'products.ndjson', b'{"name": "Imported", "description": "d", "price": 5, "image_url": "", '
+                           b'"stock": 1, "category": 1}\n', 'application/x-ndjson')}}),
+    Case('PUT', '/v1/products/{product_slug}', '/v1/products/routing-product', 'primary', 'supplier',
+         {'json': {**PRODUCT, 'price': 11}}),
+    Case('DELETE', '/v1/products/', '/v1/products/?product_id=3', 'primary', 'supplier'),
+
+    Case('GET', '/v1/review/', '/v1/review/', 'replica'),
+    Case('GET', '/v1/review/{product_id}', '/v1/review/1', 'replica'),
+    Case('GET', '/v1/review/{product_id}/summary', '/v1/review/1/summary', 'replica'),
+    Case('POST', '/v1/review/', '/v1/review/', 'primary', 'customer',
+         {'json': {'comment': 'ok', 'grade': 5, 'product_id': 1}}),
+    Case('DELETE', '/v1/review/{product_id}', '/v1/review/1?review_id=1', 'primary', 'admin'),
+
+    Case('POST', '/v1/cart/', '/v1/cart/', 'primary', 'customer', {'json': {'product_id': 1, 'quantity': 1}}),
+    Case('PUT', '/v1/cart/', '/v1/cart/', 'primary', 'customer', {'json': {'product_id': 1, 'quantity': 2}}),
+    Case('GET', '/v1/cart/', '/v1/cart/', 'primary', 'customer'),
+    Case('DELETE', '/v1/cart/{product_id}', '/v1/cart/1', 'primary', 'customer'),
+    Case('POST', '/v1/cart/', '/v1/cart/', 'primary', 'customer', {'json': {'product_id': 2, 'quantity': 1}}),
+    Case('POST', '/v1/orders/checkout', '/v1/orders/checkout', 'primary', 'customer'),
+    Case('GET', '/v1/orders/', '/v1/orders/', 'primary', 'customer'),
+    Case('GET', '/v1/orders/{order_id}', '/v1/orders/1', 'primary', 'customer'),
+
+    Case('GET', '/v1/auth/read_current_user', '/v1/auth/read_current_user', None, 'customer'),
+    Case('GET', '/v1/auth/users/me', f'/v1/auth/users/me?username=customer&password={PASSWORD}', 'primary'),
+    Case('POST', '/v1/auth/token', '/v1/auth/token', 'primary', None,
+         {'data': {'username': 'customer', 'password': PASSWORD}}),
+    Case('POST', '/v1/auth/', '/v1/auth/', 'primary', None, {'json': {
+        'first_name': 'New', 'last_name': 'User', 'username': 'new-user', 'email': 'new-user@example.com',
+        'password': PASSWORD}}),
+    Case('PATCH', '/v1/permission/', '/v1/permission/?user_id=4', 'primary', 'admin'),
+    Case('DELETE', '/v1/permission/delete', '/v1/permission/delete?user_id=4', 'primary', 'admin'),
+]
+
+USERS = {
+    'admin': {'id': 1, 'is_admin': True, 'is_supplier': False, 'is_customer': False},
+    'supplier': {'id': 2, 'is_admin': False, 'is_supplier': True, 'is_customer': False},
+    'customer': {'id': 3, 'is_admin': False, 'is_supplier': False, 'is_customer': True},
+    'spare': {'id': 4, 'is_admin': False, 'is_supplier': False, 'is_customer': True},
+}
+
+
+async def seed(db_engine: AsyncEngine):
+    '''Одинаковые данные в обеих базах: реплика здесь - копия основной на момент старта'''
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [
+            {'username': name, 'email': f'{name}@example.com', 'hashed_password': bcrypt_context.hash(PASSWORD,
+                                                                                                   rounds=4),
+             **flags}
+            for name, flags in USERS.items()
+        ])
+        await conn.execute(insert(Category).values(id=1, name='Root', slug='root'))
+        await conn.execute(insert(Product), [
+            {'id': i, 'name': f'Product {i}', 'slug': f'product-{i}', 'price': i, 'stock': 5, 'category_id': 1,
+             'user_id': 2, 'is_active': True}
+            for i in range(1, 11)
+        ])
+        await conn.execute(insert(Review), [
+            {'product_id': 1 + i % 10, 'user_id': 3, 'grade': i % 6, 'is_active': True} for i in range(20)
+        ])
+        await rebuild_listing(conn)
+
+
+def count_statements(db_engine: AsyncEngine, counter: dict, role: str):
+    @event.listens_for(db_engine.sync_engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter[role] += 1
+
+
+def capture_role(asgi_app, roles: list):
+    '''Снаружи всех middleware: state запроса общий у app и смонтированного app_v1'''
+
+    async def wrapper(scope, receive, send):
+        if scope['type'] == 'http':
+            scope['state'] = state = {}
+            try:
+                await asgi_app(scope, receive, send)
+            finally:
+                roles.append(state.get('db_role'))
+        else:
+            await asgi_app(scope, receive, send)
+
+    return wrapper
+
+
+def app_routes() -> set[tuple[str, str]]:
+    routes = set()
+    for prefix, application in (('', app), ('/v1', app_v1)):
+        for route in application.routes:
+            if isinstance(route, APIRoute):
+                routes |= {(method, prefix + route.path) for method in route.methods}
+    return routes
+
+
+async def main() -> int:
+    await seed(engine)
+    await seed(replica_engine)
+    headers = {
+        name: {'Authorization': 'Bearer ' + await create_access_token(
+            name, flags['id'], flags['is_admin'], flags['is_supplier'], flags['is_customer'], timedelta(minutes=30))}
+        for name, flags in USERS.items()
+    }
+    statements = {'primary': 0, 'replica': 0}
+    count_statements(engine, statements, 'primary')
+    count_statements(replica_engine, statements, 'replica')
+    roles: list[str | None] = []
+    errors: list[str] = []
+
+    async def call(client: httpx.AsyncClient, case: Case, expected: str | None, label: str):
+        # Отложенный пересчёт рейтингов прошлой записи не должен попасть в счётчики этого запроса
+        await write_behind.join()
+        statements.update(primary=0, replica=0)
+        response = await client.request(case.method, case.url, headers=headers.get(case.user), **case.options)
+        role, on_replica = roles[-1], statements['replica']
+        line = f'{label:<7} {case.method:<6} {case.url:<60} {response.status_code} {role or "-":<8}'
+        problems = []
+        if response.status_code >= 400:
+            problems.append(f'status {response.status_code}: {response.text[:200]}')
+        if role != expected:
+            problems.append(f'db_role {role!r}, expected {expected!r}')
+        if expected == 'replica' and not on_replica:
+            problems.append('no statements on the replica')
+        if expected != 'replica' and on_replica:
+            problems.append(f'{on_replica} statements on the replica')
+        print(line, 'ok' if not problems else 'FAIL ' + '; '.join(problems))
+        errors.extend(f'{label} {case.method} {case.url}: {problem}' for problem in problems)
+        return response
+
+    transport = httpx.ASGITransport(app=capture_role(app, roles))
+    async with httpx.AsyncClient(transport=transport, base_url='http://routing.test', timeout=60) as client:
+        for case in ROUTES:
+            client.cookies.clear()
+            await call(client, case, case.expected, 'route')
+
+        # Сразу после записи чтения того же клиента закреплены за основной базой
+        client.cookies.clear()
+        write = Case('POST', '/v1/review/', '/v1/review/', 'primary', 'customer',
+                     {'json': {'comment': 'pin', 'grade': 4, 'product_id': 2}})
+        response = await call(client, write, 'primary', 'write')
+        if READ_YOUR_WRITES_COOKIE not in response.cookies:
+            errors.append(f'write response did not set the {READ_YOUR_WRITES_COOKIE} cookie')
+        for case in ROUTES:
+            if case.expected == 'replica':
+                await call(client, case, 'primary', 'pinned')
+
+        # Клиент без куки читает сброшенные записью страницы с реплики; в кэш они не попадают
+        client.cookies.clear()
+        write = Case('POST', '/v1/review/', '/v1/review/', 'primary', 'customer',
+                     {'json': {'comment': 'stale', 'grade': 3, 'product_id': 4}})
+        await call(client, write, 'primary', 'write')
+        for url in ('/v1/products/detail/product-4', '/v1/products/batch?slug=product-4', '/v1/products/',
+                    '/v1/products/root'):
+            for _ in range(2):
+                client.cookies.clear()
+                await call(client, Case('GET', url, url, 'replica'), 'replica', 'lagging')
+
+        # Просроченная кука больше ничего не закрепляет
+        client.cookies.set(READ_YOUR_WRITES_COOKIE, '1', domain='routing.test')
+        listing = next(case for case in ROUTES if case.route == '/v1/products/' and case.method == 'GET')
+        await call(client, listing, 'replica', 'expired')
+
+    missing = app_routes() - {(case.method, case.route) for case in ROUTES}
+    for method, path in sorted(missing, key=lambda route: route[1]):
+        errors.append(f'route {method} {path} is not covered by ROUTES')
+
+    for error in errors:
+        print('FAIL', error)
+    if not errors:
+        print(f'ok: {len(ROUTES)} routes use the expected database, reads after a write stay on the primary, '
+              'the cache keeps nothing read from the lagging replica')
+    await write_behind.stop()
+    await engine.dispose()
+    await replica_engine.dispose()
+    benchmarks.cleanup()
+    if REPLICA_DB_FILE and os.path.exists(REPLICA_DB_FILE):
+        os.unlink(REPLICA_DB_FILE)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
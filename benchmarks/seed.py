@@ -0,0 +1,205 @@
+"""Synthetic catalog generator.
+
+Bulk-loads users, a category tree, products and reviews into the database from
+DB_URL (a temporary SQLite file by default). All tables are dropped first, so a
+database given through DB_URL is only seeded with --force:
+
+    python -m benchmarks.seed --products 1000000 --reviews 10000000 --depth 5 --fanout 4
+
+Ids, names and slugs are deterministic, so the load driver can address any row
+without querying for it: categories are ``category-<id>``, products ``product-<id>``,
+users ``admin``, ``supplier-<n>`` and ``customer-<n>``.
+"""
+import argparse
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import benchmarks
+from sqlalchemy import Numeric, cast, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.backend.db import engine
+from app.backend.hashing import bcrypt_context
+from app.backend.listing import rebuild_listing
+from app.models import Base, Category, Product, Review, ReviewGradeCount, User
+
+PASSWORD = 'benchmark-password'
+
+# Словарь для имён и описаний товаров, чтобы полнотекстовому поиску было что ранжировать
+ADJECTIVES = ['red', 'blue', 'green', 'black', 'white', 'compact', 'wireless', 'smart', 'classic', 'premium',
+              'portable', 'electric', 'wooden', 'steel', 'organic', 'vintage']
+NOUNS = ['phone', 'laptop', 'kettle', 'chair', 'lamp', 'backpack', 'watch', 'camera', 'speaker', 'jacket',
+         'shoes', 'shovel', 'blender', 'monitor', 'keyboard', 'bicycle', 'tent', 'mug', 'headphones', 'drill']
+
+
+@dataclass
+class SeedConfig:
+    products: int = 10_000
+    reviews: int = 50_000
+    suppliers: int = 20
+    customers: int = 1_000
+    depth: int = 3
+    fanout: int = 4
+    chunk: int = 10_000
+    seed: int = 42
+    # Разрешить пересоздание таблиц в базе, которую задали через DB_URL
+    force: bool = False
+
+
+@dataclass
+class Dataset:
+    '''Что лежит в базе: диапазоны id, которыми пользуется генератор нагрузки'''
+    products: int
+    reviews: int
+    categories: int
+    suppliers: int
+    customers: int
+
+    @property
+    def users(self) -> int:
+        return 1 + self.suppliers + self.customers
+
+
+def category_rows(depth: int, fanout: int) -> list[dict]:
+    rows, level, next_id = [], [None], 1
+    for _ in range(depth):
+        next_level = []
+        for parent_id in level:
+            for _ in range(fanout):
+                rows.append({'id': next_id, 'name': f'Category {next_id}', 'slug': f'category-{next_id}',
+                             'parent_id': parent_id, 'is_active': True})
+                next_level.append(next_id)
+                next_id += 1
+        level = next_level
+    return rows
+
+
+def user_rows(config: SeedConfig, hashed_password: str) -> list[dict]:
+    base = {'first_name': 'Bench', 'last_name': 'User', 'hashed_password': hashed_password, 'is_active': True}
+    rows = [{'id': 1, 'username': 'admin', 'email': 'admin@example.com',
+             'is_admin': True, 'is_supplier': False, 'is_customer': False, **base}]
+    for n in range(1, config.suppliers + 1):
+        rows.append({'id': len(rows) + 1, 'username': f'supplier-{n}', 'email': f'supplier-{n}@example.com',
+                     'is_admin': False, 'is_supplier': True, 'is_customer': False, **base})
+    for n in range(1, config.customers + 1):
+        rows.append({'id': len(rows) + 1, 'username': f'customer-{n}', 'email': f'customer-{n}@example.com',
+                     'is_admin': False, 'is_supplier': False, 'is_customer': True, **base})
+    return rows
+
+
+def product_rows(config: SeedConfig, categories: int, rng: random.Random):
+    for start in range(1, config.products + 1, config.chunk):
+        yield [
+            {'id': i, 'name': f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {i}', 'slug': f'product-{i}',
+             'description': ' '.join(rng.choices(ADJECTIVES + NOUNS, k=rng.randint(5, 40))),
+             'price': rng.randint(100, 500_000), 'image_url': f'https://img.bench.local/{i}.jpg',
+             'stock': 0 if rng.random() < 0.1 else rng.randint(1, 500),
+             'rating': 0.0, 'review_count': 0, 'grade_sum': 0, 'is_active': rng.random() > 0.02,
+             'category_id': rng.randint(1, categories), 'user_id': 2 + (i % config.suppliers)}
+            for i in range(start, min(start + config.chunk, config.products + 1))
+        ]
+
+
+def review_rows(config: SeedConfig, rng: random.Random):
+    first_customer = 2 + config.suppliers
+    started = datetime(2024, 1, 1)
+    for start in range(1, config.reviews + 1, config.chunk):
+        yield [
+            {'id': i, 'comment': 'Synthetic review ' + 'text ' * rng.randint(1, 30),
+             'creation_date': started + timedelta(seconds=i * 7), 'grade': rng.randint(0, 5),
+             'is_active': rng.random() > 0.05,
+             # Степенное распределение: небольшая часть товаров собирает большую часть отзывов
+             'product_id': min(config.products, 1 + int(config.products * rng.random() ** 3)),
+             'user_id': first_customer + rng.randrange(config.customers)}
+            for i in range(start, min(start + config.chunk, config.reviews + 1))
+        ]
+
+
+async def recompute_ratings(db_engine: AsyncEngine):
+    stats = select(
+        Review.product_id,
+        func.count().label('review_count'),
+        func.sum(Review.grade).label('grade_sum'),
+    ).where(Review.is_active == True).group_by(Review.product_id).subquery()
+    async with db_engine.begin() as conn:
+        await conn.execute(update(Product).where(Product.id == stats.c.product_id).values(
+            review_count=stats.c.review_count, grade_sum=stats.c.grade_sum))
+        await conn.execute(update(Product).where(Product.review_count > 0).values(
+            rating=func.round(cast(Product.grade_sum, Numeric) / Product.review_count, 1)))
+        await conn.execute(insert(ReviewGradeCount).from_select(
+            ['product_id', 'grade', 'count'],
+            select(Review.product_id, Review.grade, func.count()).where(Review.is_active == True)
+            .group_by(Review.product_id, Review.grade)))
+
+
+async def seed(config: SeedConfig, db_engine: AsyncEngine = engine, verbose: bool = True) -> Dataset:
+    rng = random.Random(config.seed)
+
+    def log(message: str):
+        if verbose:
+            print(f'[seed] {message}', flush=True)
+
+    if not config.force and not benchmarks.is_temporary(db_engine.url):
+        raise SystemExit(f'[seed] refusing to drop all tables in {db_engine.url.render_as_string()}: '
+                         f'it is not a temporary benchmark database, pass --force to seed it anyway')
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    started = time.perf_counter()
+    categories = category_rows(config.depth, config.fanout)
+    async with db_engine.begin() as conn:
+        await conn.execute(insert(User), user_rows(config, bcrypt_context.hash(PASSWORD)))
+        await conn.execute(insert(Category), categories)
+    log(f'{1 + config.suppliers + config.customers} users, {len(categories)} categories')
+
+    for rows in product_rows(config, len(categories), rng):
+        async with db_engine.begin() as conn:
+            await conn.execute(insert(Product), rows)
+        log(f'products: {rows[-1]["id"]}/{config.products}')
+    for rows in review_rows(config, rng):
+        async with db_engine.begin() as conn:
+            await conn.execute(insert(Review), rows)
+        log(f'reviews: {rows[-1]["id"]}/{config.reviews}')
+
+    await recompute_ratings(db_engine)
+    async with db_engine.begin() as conn:
+        log(f'product_listing: {await rebuild_listing(conn)} rows')
+    log(f'done in {time.perf_counter() - started:.1f}s')
+    return Dataset(products=config.products, reviews=config.reviews, categories=len(categories),
+                   suppliers=config.suppliers, customers=config.customers)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = SeedConfig()
+    parser.add_argument('--products', type=int, default=defaults.products)
+    parser.add_argument('--reviews', type=int, default=defaults.reviews)
+    parser.add_argument('--suppliers', type=int, default=defaults.suppliers)
+    parser.add_argument('--customers', type=int, default=defaults.customers)
+    parser.add_argument('--depth', type=int, default=defaults.depth, help='levels in the category tree')
+    parser.add_argument('--fanout', type=int, default=defaults.fanout, help='children per category')
+    parser.add_argument('--chunk', type=int, default=defaults.chunk, help='rows per INSERT batch')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--force', action='store_true',
+                        help='drop and recreate all tables even if DB_URL points to a real database')
+
+
+def config_from_args(args: argparse.Namespace) -> SeedConfig:
+    return SeedConfig(products=args.products, reviews=args.reviews, suppliers=args.suppliers,
+                      customers=args.customers, depth=args.depth, fanout=args.fanout,
+                      chunk=args.chunk, seed=args.seed, force=args.force)
+
+
+async def main(args: argparse.Namespace):
+    await seed(config_from_args(args))
+    await engine.dispose()
+    print(f'[seed] database: {engine.url.render_as_string(hide_password=True)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
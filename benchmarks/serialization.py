@@ -0,0 +1,57 @@
+"""Old vs new serialization of a product listing.
+
+Compares FastAPI's default path for ORM instances (jsonable_encoder + json.dumps)
+with the row-mapping path used by the routers (orjson via FastJSONResponse):
+
+    python -m benchmarks.serialization --products 10000
+"""
+import argparse
+import json
+import timeit
+
+import benchmarks
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.backend.responses import FastJSONResponse
+from app.models import Product
+from app.routers.products import PRODUCT_FIELDS
+from app.schemas import ProductOut
+
+
+def make_rows(count: int) -> list[dict]:
+    return [
+        {'id': i, 'name': f'Product {i}', 'slug': f'product-{i}', 'description': 'x' * 200, 'price': i,
+         'image_url': f'http://example.com/{i}.jpg', 'stock': 10, 'rating': 4.5, 'review_count': 12,
+         'is_active': True, 'category_id': i % 50, 'user_id': 1}
+        for i in range(count)
+    ]
+
+
+def main(args):
+    rows = make_rows(args.products)
+    orm_products = [Product(**row, grade_sum=54) for row in rows]
+    products_adapter = TypeAdapter(list[ProductOut])
+    assert list(rows[0]) == list(PRODUCT_FIELDS)
+
+    cases = {
+        'ORM + jsonable_encoder + json.dumps (old)':
+            lambda: json.dumps(jsonable_encoder(orm_products)).encode(),
+        'ORM + response_model (pydantic)':
+            lambda: products_adapter.dump_json(products_adapter.validate_python(orm_products, from_attributes=True)),
+        'row mappings + FastJSONResponse (new)':
+            lambda: FastJSONResponse(rows).body,
+    }
+    baseline = None
+    for title, func in cases.items():
+        seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        baseline = baseline or seconds
+        print(f'{title:45} {seconds * 1000:8.1f} ms  x{baseline / seconds:.1f}')
+    benchmarks.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    main(parser.parse_args())